@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Поколения CachedCount (api/pagination.py) хранятся в кеше default.
+    С кешем в памяти процесса изменение в одном воркере не сбрасывает
+    закешированные счетчики в остальных.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кеш default ({backend}) не общий для процессов: счетчики '
+        'страниц в других воркерах сбросятся только по таймауту.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION, например '
+             'django.core.cache.backends.db.DatabaseCache.',
+        id='api.W001',
+    )]
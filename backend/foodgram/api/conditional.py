@@ -0,0 +1,44 @@
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+from recipes import catalog
+
+
+class CatalogConditionalMixin:
+    """
+    Условные GET для справочников. ETag строится из версии
+    справочников catalog_models и не зависит от пользователя, поэтому
+    проверка If-None-Match идет до аутентификации DRF: ответ 304
+    отдается без запросов к БД и без сериализаторов.
+    """
+    catalog_models = ()
+    catalog_max_age = 60
+
+    def get_catalog_etag(self, request):
+        variant = hashlib.md5('|'.join((
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+        )).encode()).hexdigest()[:12]
+        version = catalog.get_version(*self.catalog_models)
+        return quote_etag(f'{version}-{variant}')
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        etag = self.get_catalog_etag(request)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=self.catalog_max_age
+        )
+        patch_vary_headers(response, ('Accept',))
+        return response
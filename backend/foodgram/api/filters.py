@@ -1,6 +1,10 @@
 import django_filters as filters
+from django.db.models import Exists, OuterRef
 
-from recipes.models import Recipe, Tag
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+
+TRUE_VALUES = ('1', 'true', 'True')
+FALSE_VALUES = ('0', 'false', 'False')
 
 
 class RecipeFilter(filters.FilterSet):
@@ -8,12 +12,17 @@ class RecipeFilter(filters.FilterSet):
     Фильтрация по нескольким тегам, с использованием
     поля slug объекта tag.
     Для не содержащихся в модели полей реализованы кастомные фильтры.
+    Все фильтры дополняют входящий queryset условиями EXISTS,
+    без JOIN-ов: строки рецептов не размножаются, DISTINCT не нужен,
+    а подзапросы идут по индексам связных таблиц
+    (см. api/tests/test_query_plans.py).
     """
 
+    author = filters.NumberFilter(field_name='author_id')
     tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
     )
     is_favorited = filters.CharFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.CharFilter(
@@ -22,16 +31,35 @@ class RecipeFilter(filters.FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ['tags']
+        fields = ['author', 'tags']
 
-    def filter_is_favorited(filterobj, queryset, field_name, value):
+    def filter_tags(self, queryset, name, value):
         if not value:
             return queryset
-        return Recipe.objects.filter(favorite__user=filterobj.request.user)
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=value
+            )
+        ))
 
-    def filter_is_in_shopping_cart(filterobj, queryset, field_name, value):
-        if not value:
+    def filter_related_to_user(self, queryset, model, value):
+        """
+        1/true - только рецепты, связанные с пользователем через model,
+        0/false - только не связанные.
+        """
+        if value not in TRUE_VALUES + FALSE_VALUES:
             return queryset
-        return Recipe.objects.filter(
-            shopping_cart__user=filterobj.request.user
+        selected = value in TRUE_VALUES
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if selected else queryset
+        exists = Exists(
+            model.objects.filter(user=user, recipe=OuterRef('pk'))
         )
+        return queryset.filter(exists if selected else ~exists)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_related_to_user(queryset, Favorite, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_related_to_user(queryset, ShoppingCart, value)
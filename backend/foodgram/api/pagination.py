@@ -1,7 +1,413 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import heapq
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import partial
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+PAGINATION_PARAMS = ('page', 'limit', 'cursor')
+
+
+class ExactCount:
+    """
+    Точный COUNT(*) на каждый запрос - поведение по умолчанию.
+    """
+
+    def count(self, queryset, request):
+        return queryset.count()
+
+
+class CachedCount(ExactCount):
+    """
+    Кеширует точный COUNT(*) по нормализованному набору фильтров
+    на timeout секунд. Кеш сбрасывается при изменениях моделей
+    из invalidate_on: в ключ входит "поколение" каждой модели,
+    которое увеличивается сигналами после фиксации транзакции.
+    Для обычных моделей это создание и удаление объектов (в том
+    числе каскадное), для промежуточных моделей ManyToManyField
+    (например, Recipe.tags.through) - m2m_changed.
+    Если в запросе есть параметры из private_params, в ключ
+    добавляется id пользователя.
+    Поколения живут в кеше default, поэтому сбрасывают счетчики
+    во всех процессах только с общим для процессов бэкендом
+    (CACHE_BACKEND, см. api/checks.py); с LocMemCache другие
+    воркеры видят изменения не раньше чем через timeout.
+    """
+
+    def __init__(self, timeout=60, invalidate_on=(), private_params=()):
+        self.timeout = timeout
+        self.invalidate_on = invalidate_on
+        self.private_params = private_params
+        for model in invalidate_on:
+            uid = f'count-generation-{model._meta.label}'
+            if model._meta.auto_created:
+                m2m_changed.connect(
+                    self.on_m2m_change, sender=model, weak=False,
+                    dispatch_uid=uid
+                )
+                continue
+            post_save.connect(
+                self.on_save, sender=model, weak=False, dispatch_uid=uid
+            )
+            post_delete.connect(
+                self.on_delete, sender=model, weak=False, dispatch_uid=uid
+            )
+
+    @staticmethod
+    def generation_key(model):
+        return f'count-generation:{model._meta.label}'
+
+    @classmethod
+    def bump(cls, model):
+        key = cls.generation_key(model)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+    @classmethod
+    def bump_on_commit(cls, model):
+        """
+        До фиксации другие запросы еще видят старые данные и
+        закешировали бы старый счетчик под новым поколением.
+        """
+        transaction.on_commit(lambda: cls.bump(model))
+
+    @classmethod
+    def on_save(cls, sender, created, **kwargs):
+        if created:
+            cls.bump_on_commit(sender)
+
+    @classmethod
+    def on_delete(cls, sender, **kwargs):
+        cls.bump_on_commit(sender)
+
+    @classmethod
+    def on_m2m_change(cls, sender, action, **kwargs):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            cls.bump_on_commit(sender)
+
+    def signature(self, queryset, request):
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+            if key not in PAGINATION_PARAMS
+        )
+        if any(key in self.private_params for key, _ in params):
+            params.append(('user', [str(request.user.pk)]))
+        keys = [self.generation_key(model) for model in self.invalidate_on]
+        generations = cache.get_many(keys)
+        raw = json.dumps([
+            queryset.model._meta.label,
+            params,
+            [generations.get(key, 0) for key in keys],
+        ])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def count(self, queryset, request):
+        key = f'count:{self.signature(queryset, request)}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count(queryset, request)
+            cache.set(key, count, self.timeout)
+        return count
+
+
+class EstimatedCount:
+    """
+    Для больших таблиц без фильтров берет оценку числа строк
+    из статистики планировщика PostgreSQL (pg_class.reltuples).
+    Если фильтры есть, оценка меньше threshold или база не PostgreSQL,
+    считает через fallback.
+    """
+
+    def __init__(self, fallback=None, threshold=100_000):
+        self.fallback = fallback or ExactCount()
+        self.threshold = threshold
+
+    def estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row else None
+
+    def count(self, queryset, request):
+        estimate = self.estimate(queryset)
+        if estimate is not None and estimate >= self.threshold:
+            return estimate
+        return self.fallback.count(queryset, request)
+
+
+class CountStrategyPaginator(Paginator):
+    """
+    Django Paginator, который берет count у стратегии подсчета.
+    """
+
+    def __init__(self, object_list, per_page, count_strategy, request,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy
+        self.request = request
+
+    @cached_property
+    def count(self):
+        return self.count_strategy.count(self.object_list, self.request)
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная пагинация. Способ подсчета count задается
+    атрибутом вьюсета count_strategy (по умолчанию точный COUNT).
+    """
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 1000
+    count_strategy = ExactCount()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            CountStrategyPaginator,
+            count_strategy=getattr(
+                view, 'count_strategy', self.count_strategy
+            ),
+            request=request,
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация. Страница выбирается условием
+    по ключу сортировки (например, pub_date и id последней записи),
+    а не OFFSET-ом, поэтому N-я страница стоит столько же, сколько
+    первая, и запрос COUNT(*) не нужен.
+    Ключ сортировки берется из атрибута вьюсета cursor_ordering,
+    последнее поле должно быть уникальным.
+    """
+    page_size = CustomPagination.page_size
+    page_size_query_param = CustomPagination.page_size_query_param
+    max_page_size = CustomPagination.max_page_size
+    cursor_query_param = 'cursor'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(
+            request, self.get_position_fields(queryset)
+        )
+
+        page = self.fetch(queryset, reverse, position, page_size + 1)
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+
+        if reverse:
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = position is not None, has_more
+        self.next_position = self.previous_position = None
+        if page and has_next:
+            self.next_position = self.get_position(page[-1])
+        if page and has_previous:
+            self.previous_position = self.get_position(page[0])
+        return page
+
+    def fetch(self, queryset, reverse, position, limit):
+        return list(
+            self.window(queryset, self.ordering, reverse, position)[:limit]
+        )
+
+    def window(self, queryset, ordering, reverse, position):
+        """
+        Выборка, отсортированная по ключу ordering (в обратную сторону
+        при reverse) и начинающаяся строго после position.
+        """
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+        return queryset
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.next_position, reverse=False)),
+            ('previous', self.get_link(self.previous_position, reverse=True)),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, position):
+        """
+        Условие "строго после position" для составного ключа:
+        (a < x) OR (a = x AND b < y) OR ... для убывающих полей.
+        Избыточное a <= x задает базе диапазон по индексу, иначе
+        OR-условие проверяется на каждой строке до нужной позиции.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        first, value = ordering[0], position[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': value}) & condition
+
+    def get_position_fields(self, queryset):
+        """
+        Поля модели, по которым разбираются значения позиции курсора.
+        """
+        opts = queryset.model._meta
+        return [opts.get_field(field.lstrip('-')) for field in self.ordering]
+
+    def get_position(self, instance):
+        return self.dump_position(
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        )
+
+    @staticmethod
+    def dump_position(values):
+        return [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ]
+
+    def get_link(self, position, reverse):
+        if position is None:
+            return None
+        cursor = urlsafe_b64encode(
+            json.dumps({'r': reverse, 'p': position}).encode()
+        ).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request, fields):
+        """
+        Пустой или отсутствующий курсор означает первую страницу.
+        Значения позиции приводятся к типам полей fields: курсор
+        приходит от клиента, и испорченный курсор должен давать 404,
+        а не ошибку при построении запроса.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            reverse, position = bool(cursor['r']), list(cursor['p'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.parse_value(field, value)
+                for field, value in zip(fields, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    @staticmethod
+    def parse_value(field, value):
+        if value is None or isinstance(value, (dict, list)):
+            raise ValueError(value)
+        value = field.to_python(value)
+        if value is None:
+            raise ValueError(value)
+        return value
+
+
+class MergedKeysetPagination(KeysetPagination):
+    """
+    Курсорная пагинация по нескольким выборкам сразу: вместо queryset
+    передается список пар (выборка, ключ сортировки). Поля ключей
+    могут называться по-разному, но значения должны быть сравнимы,
+    а направление у всех полей - одно. Из каждой выборки берется
+    не больше страницы, страница собирается слиянием, строки
+    с одинаковым ключом склеиваются. Элементы страницы - кортежи
+    значений ключа.
+    """
+
+    def fetch(self, queryset, reverse, position, limit):
+        pages = []
+        for source, ordering in queryset:
+            names = [field.lstrip('-') for field in ordering]
+            pages.append(list(
+                self.window(source, ordering, reverse, position)
+                .values_list(*names)[:limit]
+            ))
+        descending = self.ordering[0].startswith('-') != reverse
+        page = []
+        for row in heapq.merge(*pages, reverse=descending):
+            if not page or row != page[-1]:
+                page.append(row)
+        return page[:limit]
+
+    def get_position_fields(self, queryset):
+        source, ordering = queryset[0]
+        opts = source.model._meta
+        return [opts.get_field(field.lstrip('-')) for field in ordering]
+
+    def get_position(self, row):
+        return self.dump_position(row)
+
+
+class KeysetPaginationMixin:
+    """
+    Включает курсорную пагинацию для запросов с параметром cursor
+    (для первой страницы - с пустым ?cursor=). Без него вьюсет
+    работает с обычной pagination_class, как и раньше.
+    """
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_param = self.keyset_pagination_class.cursor_query_param
+            if cursor_param in self.request.query_params:
+                self._paginator = self.keyset_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
@@ -0,0 +1,62 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет файл из запроса во временный файл на диске по мере чтения
+    и обрывает загрузку, как только файл превысил max_size.
+    """
+
+    def __init__(self, request, max_size):
+        super().__init__(request)
+        self.max_size = max_size
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.file.close()
+            raise MultiPartParserError(
+                f'Файл больше {self.max_size} байт.'
+            )
+        return super().receive_data_chunk(raw_data, start)
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """
+    multipart/form-data для рецептов: поля рецепта приходят JSON-ом
+    в части data (вложенные ingredients и tags не выразить обычными
+    полями формы), изображение - отдельной файловой частью image.
+    Файл не попадает в память целиком и не кодируется в base64.
+    """
+    json_field = 'data'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request._request.upload_handlers = [
+            LimitedUploadHandler(
+                request._request, settings.RECIPE_IMAGE_MAX_SIZE
+            )
+        ]
+        parsed = super().parse(stream, media_type, parser_context)
+        data = parsed.data.dict()
+        payload = data.pop(self.json_field, None)
+        if payload is not None:
+            try:
+                fields = json.loads(payload)
+            except ValueError as exc:
+                raise ParseError(
+                    f'Некорректный JSON в поле {self.json_field}: {exc}'
+                )
+            if not isinstance(fields, dict):
+                raise ParseError(
+                    f'В поле {self.json_field} ожидается JSON-объект.'
+                )
+            data.update(fields)
+        # Обычные dict: DRF объединяет data и files через dict.update,
+        # а у MultiValueDict он скопировал бы списки значений.
+        return DataAndFiles(data, parsed.files.dict())
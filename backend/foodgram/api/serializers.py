@@ -1,28 +1,89 @@
+from uuid import uuid4
+
+from django.core.files.uploadedfile import UploadedFile
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch, prefetch_related_objects
 from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
 from rest_framework import serializers
 
+from recipes import shopping_list
+from recipes.images import strip_metadata
 from recipes.models import (Favorite, Ingredient, IngredientsToRecipe, Recipe,
                             ShoppingCart, Tag)
-from users.serializers import UserSerializer
+from users.loaders import SubscribedListSerializer
+from users.serializers import RecipeImageField, UserSerializer
+
+
+# Верхняя граница bigint: число больше база не примет даже в условии
+# id IN (...), и вместо 400 получилась бы ошибка сервера.
+MAX_ID = 2 ** 63 - 1
+
+
+def to_id(value):
+    """
+    Приводит id к int. Существование объектов проверяется
+    сериализатором рецепта одним запросом на весь список.
+    """
+    if isinstance(value, bool):
+        value = None
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        pk = None
+    if pk is None or not 0 < pk <= MAX_ID:
+        raise serializers.ValidationError(f'Некорректный id: {value!r}.')
+    return pk
 
 
 class IngredientPrimaryKeyRelatedField(serializers.RelatedField):
     """
     Помогает вывести правильный id ингредиента,
     а не записи в связной модели IngredientsToRecipe.
+    Значение берется из ingredient_id строки, без запросов к БД.
     """
-    def to_representation(self, instance):
-        ingredient_in_recipe = get_object_or_404(
-            IngredientsToRecipe,
-            id=instance
-        )
-        return ingredient_in_recipe.ingredient.id
+    def get_attribute(self, instance):
+        return instance.ingredient_id
 
-    def to_internal_value(self, value):
+    def to_representation(self, value):
         return value
 
+    def to_internal_value(self, value):
+        return to_id(value)
+
+
+class RecipeImageUploadField(Base64ImageField):
+    """
+    Изображение рецепта: base64-строка в JSON или файл из multipart
+    (см. api/parsers.py). У файла проверяется только заголовок:
+    формат и размеры читаются без декодирования пикселей.
+    """
+    UPLOAD_FORMATS = {
+        'JPEG': 'jpg',
+        'PNG': 'png',
+        'GIF': 'gif',
+        'WEBP': 'webp',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        try:
+            with Image.open(data) as image:
+                image_format, (width, height) = image.format, image.size
+        except (OSError, Image.DecompressionBombError):
+            raise serializers.ValidationError(
+                self.error_messages['invalid_image']
+            )
+        extension = self.UPLOAD_FORMATS.get(image_format)
+        if extension is None or width * height > Image.MAX_IMAGE_PIXELS:
+            raise serializers.ValidationError(
+                self.error_messages['invalid_image']
+            )
+        data.seek(0)
+        data.name = f'{uuid4()}.{extension}'
+        return data
+
 
 class TagSerializer(serializers.ModelSerializer):
     """
@@ -43,7 +104,7 @@ class TagsPrimaryKeyRelatedField(serializers.RelatedField):
         return serializer.data
 
     def to_internal_value(self, value):
-        return value
+        return to_id(value)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -58,9 +119,14 @@ class IngredientSerializer(serializers.ModelSerializer):
 class IngredientsToRecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор связной модели для ингредиентов в рецепте.
+    Название и единицы измерения читаются из связанного Ingredient,
+    поэтому queryset стоит подгружать с select_related('ingredient').
     """
-    name = serializers.SerializerMethodField()
-    measurement_unit = serializers.SerializerMethodField()
+    name = serializers.CharField(source='ingredient.name', read_only=True)
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit',
+        read_only=True
+    )
     id = IngredientPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
 
     class Meta:
@@ -74,18 +140,12 @@ class IngredientsToRecipeSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def get_measurement_unit(self, instance):
-        ingredient = Ingredient.objects.get(id=instance.ingredient_id)
-        return ingredient.measurement_unit
-
-    def get_name(self, instance):
-        ingredient = Ingredient.objects.get(id=instance.ingredient_id)
-        return ingredient.name
-
 
 class RecipeReadSerializer(serializers.ModelSerializer):
     """
     Чтение рецепта.
+    Флаги is_favorited и is_in_shopping_cart берутся из аннотаций
+    queryset-а (см. RecipeViewSet.get_queryset), если они есть.
     """
     author = UserSerializer()
     ingredients = IngredientsToRecipeSerializer(
@@ -95,24 +155,30 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(
         many=True
     )
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
-        fields = '__all__'
+        exclude = ('favorited_count', 'image_variants')
         model = Recipe
+        list_serializer_class = SubscribedListSerializer
+        subscription_author_field = 'author_id'
 
     def get_is_favorited(self, instance):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(instance, 'is_favorited'):
+            return instance.is_favorited
         return Favorite.objects.filter(user=user, recipe=instance).exists()
 
     def get_is_in_shopping_cart(self, instance):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(instance, 'is_in_shopping_cart'):
+            return instance.is_in_shopping_cart
         return ShoppingCart.objects.filter(user=user, recipe=instance).exists()
 
 
@@ -126,30 +192,96 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         source='recipe_with_ingredients'
     )
     tags = TagsPrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageUploadField(max_length=None, use_url=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
-        fields = '__all__'
+        exclude = ('favorited_count', 'image_variants')
         model = Recipe
 
+    def to_representation(self, instance):
+        """
+        Ингредиенты для ответа читаются одним запросом вместе
+        с Ingredient, а не по запросу на строку.
+        """
+        prefetch_related_objects([instance], Prefetch(
+            'recipe_with_ingredients',
+            queryset=IngredientsToRecipe.objects.select_related('ingredient')
+        ))
+        return super().to_representation(instance)
+
     def validate_cooking_time(self, value):
         if value < 1:
             raise serializers.ValidationError('Укажите время готовки > 1 мин.')
         return value
 
+    def validate_ingredients(self, value):
+        ids = [ingredient['id'] for ingredient in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться.'
+            )
+        existing = set(
+            Ingredient.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        missing = [pk for pk in ids if pk not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}.'
+            )
+        return value
+
+    def validate_tags(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError(
+                'Теги в рецепте не должны повторяться.'
+            )
+        existing = set(
+            Tag.objects.filter(id__in=value).values_list('id', flat=True)
+        )
+        missing = [pk for pk in value if pk not in existing]
+        if missing:
+            raise serializers.ValidationError(f'Теги не найдены: {missing}.')
+        return value
+
     def create_ingredients(self, ingredients, recipe):
-        ingredient_list = []
-        IngredientsToRecipe.objects.filter(recipe=recipe).delete()
-        for ingredient in ingredients:
-            ingredient_obj = get_object_or_404(Ingredient, id=ingredient['id'])
-            ingredient_list.append(
-                IngredientsToRecipe(
-                    recipe=recipe, ingredient=ingredient_obj,
-                    amount=ingredient['amount'])
-                )
-        IngredientsToRecipe.objects.bulk_create(ingredient_list)
+        """
+        Приводит ингредиенты рецепта к переданному списку, меняя только
+        отличающиеся строки: новые добавляются, у оставшихся
+        обновляется количество, лишние удаляются.
+        """
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {}
+        stale = []
+        rows = IngredientsToRecipe.objects.filter(recipe=recipe).only(
+            'id', 'ingredient_id', 'amount'
+        )
+        for row in rows:
+            ingredient_id = row.ingredient_id
+            if ingredient_id in current or ingredient_id not in amounts:
+                stale.append(row.id)
+            else:
+                current[ingredient_id] = row
+        changed = []
+        for ingredient_id, row in current.items():
+            if row.amount != amounts[ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                changed.append(row)
+        if stale:
+            IngredientsToRecipe.objects.filter(id__in=stale).delete()
+        if changed:
+            IngredientsToRecipe.objects.bulk_update(changed, ('amount',))
+        IngredientsToRecipe.objects.bulk_create(
+            IngredientsToRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
 
     def get_is_favorited(self, instance):
         user = self.context['request'].user
@@ -168,27 +300,51 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return ShoppingCart.objects.filter(user=user, recipe=instance).exists()
 
     def create_tags(self, tags, recipe):
-        current_tags = recipe.tags.all()
-        for current_tag in current_tags:
-            recipe.tags.remove(current_tag)
-        for tag in tags:
-            recipe.tags.add(tag)
+        # set() сам сравнивает с текущими тегами и меняет только разницу.
+        recipe.tags.set(tags)
+
+    def save_image(self, validated_data):
+        """
+        Записывает файл изображения в хранилище до начала транзакции,
+        чтобы она не держалась открытой на время записи. В модель
+        попадает уже имя сохраненного файла. Оригинал доступен
+        по публичному URL, поэтому сохраняется без метаданных.
+        """
+        image = validated_data.get('image')
+        if image is None:
+            return
+        cleaned = strip_metadata(image)
+        field = Recipe._meta.get_field('image')
+        validated_data['image'] = field.storage.save(
+            field.generate_filename(None, cleaned.name),
+            cleaned,
+            max_length=field.max_length,
+        )
+        image.close()
 
-    @transaction.atomic
     def update(self, instance, validated_data):
-        tags_data = validated_data.pop('tags')
-        ingredients = validated_data.pop('recipe_with_ingredients')
-        instance = super().update(instance, validated_data)
-        self.create_tags(tags_data, instance)
-        self.create_ingredients(ingredients, instance)
+        self.save_image(validated_data)
+        with transaction.atomic():
+            tags_data = validated_data.pop('tags')
+            ingredients = validated_data.pop('recipe_with_ingredients')
+            old_lines = shopping_list.recipe_lines(instance.id)
+            instance = super().update(instance, validated_data)
+            self.create_tags(tags_data, instance)
+            self.create_ingredients(ingredients, instance)
+            shopping_list.recipe_changed(
+                instance.id,
+                old_lines,
+                shopping_list.recipe_lines(instance.id)
+            )
         return instance
 
-    @transaction.atomic
     def create(self, validated_data):
-        tags_data = validated_data.pop('tags')
-        ingredients = validated_data.pop('recipe_with_ingredients')
-        validated_data['author'] = self.context['request'].user
-        instance = super().create(validated_data)
-        self.create_tags(tags_data, instance)
-        self.create_ingredients(ingredients, instance)
+        self.save_image(validated_data)
+        with transaction.atomic():
+            tags_data = validated_data.pop('tags')
+            ingredients = validated_data.pop('recipe_with_ingredients')
+            validated_data['author'] = self.context['request'].user
+            instance = super().create(validated_data)
+            self.create_tags(tags_data, instance)
+            self.create_ingredients(ingredients, instance)
         return instance
@@ -0,0 +1,198 @@
+"""
+Экспорт списка покупок в разных форматах.
+Текст и CSV отдаются генераторами построчно. PDF собирается
+в отдельном пуле процессов ограниченного размера и складывается
+в файл SHOPPING_LIST_PDF_DIR/<id пользователя>-<версия списка>.pdf;
+запрос, который его заказал, не ждет сборки (см. download_shopping_cart
+в api/views.py).
+"""
+import csv
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.background import BackgroundPool
+
+logger = logging.getLogger(__name__)
+
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+class ExportBusy(Exception):
+    """
+    Пул генерации PDF занят, запрос стоит повторить позже.
+    """
+
+
+def render_text(rows):
+    for name, unit, total in rows:
+        yield f'{name}, {unit} : {total}\n'
+
+
+class Echo:
+    """
+    Объект с интерфейсом файла, который просто возвращает записанное:
+    позволяет отдавать строки csv.writer по одной.
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единицы', 'Количество'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def build_pdf(rows, font_path):
+    """
+    Собирает PDF целиком. Выполняется в дочернем процессе,
+    поэтому получает и возвращает только простые типы.
+    """
+    font = 'Helvetica'
+    if font_path and os.path.exists(font_path):
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+        font = PDF_FONT_NAME
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = 50
+    pdf.setFont(font, 16)
+    pdf.drawString(margin, height - margin, 'Список покупок')
+    y = height - margin - 30
+    pdf.setFont(font, 12)
+    for name, unit, total in rows:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = height - margin
+        pdf.drawString(margin, y, f'{name} ({unit}) — {total}')
+        y -= 18
+    pdf.save()
+    return buffer.getvalue()
+
+
+def write_pdf(rows, font_path, path, stale_prefix):
+    """
+    Собирает PDF в файл path. Файл пишется под временным именем
+    и атомарно подменяется, так что читатели не видят его
+    недописанным. Файлы прежних версий списка (имена, начинающиеся
+    с stale_prefix) удаляются.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(build_pdf(rows, font_path))
+    os.replace(temporary, path)
+    for name in os.listdir(directory):
+        stale = os.path.join(directory, name)
+        if name.startswith(stale_prefix) and stale != path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+class PdfExportPool:
+    """
+    Пул процессов для генерации PDF: разбор шрифтов и верстка идут
+    вне процесса веб-сервера, а число одновременно принятых задач
+    ограничено. schedule() только ставит задачу и сразу возвращается,
+    готовый файл забирает load() при следующем запросе; поток запроса
+    (под ASGI - общий поток синхронных представлений) сборку не ждет.
+    При переполнении ExportBusy бросается сразу.
+    Задачи учитываются в пределах одного процесса: если повторный
+    запрос попал в другой воркер раньше, чем файл готов, тот соберет
+    файл еще раз (результат тот же). Лимит тоже действует на процесс:
+    при N воркерах одновременно собирается до N * (workers + queue_size)
+    файлов, под это и подобраны значения по умолчанию.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.pool = BackgroundPool(workers, ProcessPoolExecutor)
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def path(self, user_id, version):
+        return os.path.join(
+            settings.SHOPPING_LIST_PDF_DIR, f'{user_id}-{version}.pdf'
+        )
+
+    def load(self, user_id, version):
+        """
+        Готовый PDF для этой версии списка или None.
+        """
+        try:
+            with open(self.path(user_id, version), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def schedule(self, user_id, version, rows):
+        """
+        Ставит сборку PDF в очередь, если она еще не стоит.
+        """
+        path = self.path(user_id, version)
+        executor = self.pool.get_executor()
+        with self.lock:
+            if path in self.jobs:
+                return self.jobs[path]
+            if not self.slots.acquire(blocking=False):
+                raise ExportBusy
+            try:
+                future = executor.submit(
+                    write_pdf, list(rows), settings.SHOPPING_LIST_PDF_FONT,
+                    path, f'{user_id}-'
+                )
+            except BaseException:
+                self.slots.release()
+                raise
+            self.jobs[path] = future
+        future.add_done_callback(lambda done: self.finish(path, done))
+        return future
+
+    def finish(self, path, future):
+        with self.lock:
+            self.jobs.pop(path, None)
+        self.slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                'Не удалось собрать PDF %s', path,
+                exc_info=future.exception()
+            )
+
+
+pdf_pool = PdfExportPool(
+    workers=settings.SHOPPING_LIST_PDF_WORKERS,
+    queue_size=settings.SHOPPING_LIST_PDF_QUEUE,
+)
+
+
+def render_pdf(content):
+    """
+    Готовый PDF отдается кусками.
+    """
+    return (
+        content[start:start + PDF_CHUNK_SIZE]
+        for start in range(0, len(content), PDF_CHUNK_SIZE)
+    )
+
+
+EXPORT_FORMATS = {
+    'txt': (render_text, 'text/plain; charset=UTF-8'),
+    'csv': (render_csv, 'text/csv; charset=UTF-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
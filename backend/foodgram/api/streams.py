@@ -0,0 +1,164 @@
+"""
+Поток Server-Sent Events о новых рецептах авторов, на которых
+подписан пользователь: GET /api/recipes/stream/. EventSource
+в браузере не умеет передавать заголовки, поэтому кроме
+Authorization: Token <ключ> принимается ?ticket=<билет>: билет
+выдает POST /api/recipes/stream/ticket/, он подписан SECRET_KEY
+и действует RECIPE_STREAM_TICKET_TTL секунд.
+Django 4.1 не умеет отдавать StreamingHttpResponse из асинхронного
+итератора, поэтому поток - отдельное ASGI-приложение, которое
+foodgram/asgi.py ставит перед Django. Под WSGI адрес не обслуживается.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from recipes.events import format_event, recipe_events
+from users.models import Subscription, User
+
+STREAM_PATH = '/api/recipes/stream/'
+TICKET_SALT = 'api.streams.ticket'
+RETRY_MS = 5000
+HEARTBEAT = b': ping\n\n'
+OVERFLOW = format_event('overflow', {
+    'detail': 'Часть событий пропущена, обновите ленту.'
+})
+
+
+def issue_ticket(user):
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(str(user.pk))
+
+
+def user_from_ticket(ticket):
+    try:
+        user_id = signing.TimestampSigner(salt=TICKET_SALT).unsign(
+            ticket, max_age=settings.RECIPE_STREAM_TICKET_TTL
+        )
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=user_id, is_active=True).first()
+
+
+def user_from_token(authorization):
+    authorization = authorization.split()
+    if len(authorization) != 2 or authorization[0].lower() != b'token':
+        return None
+    try:
+        user, _ = TokenAuthentication().authenticate_credentials(
+            authorization[1].decode()
+        )
+    except (AuthenticationFailed, UnicodeDecodeError):
+        return None
+    return user
+
+
+@sync_to_async
+def authenticate(scope):
+    """
+    Пользователь по билету из ?ticket= или по токену из заголовка
+    Authorization и id авторов, на которых он подписан, или None,
+    если ни то, ни другое не подошло.
+    """
+    try:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        if 'ticket' in query:
+            user = user_from_ticket(query['ticket'][0])
+        else:
+            user = user_from_token(
+                dict(scope['headers']).get(b'authorization', b'')
+            )
+        if user is None:
+            return None
+        author_ids = list(
+            Subscription.objects.filter(user=user)
+            .values_list('author_id', flat=True)
+        )
+        return user, author_ids
+    finally:
+        close_old_connections()
+
+
+async def send_json(send, status, data):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps(data, ensure_ascii=False).encode(),
+    })
+
+
+async def recipe_stream(scope, receive, send):
+    if scope['method'] != 'GET':
+        return await send_json(send, 405, {
+            'detail': f'Метод "{scope["method"]}" не разрешен.'
+        })
+    identity = await authenticate(scope)
+    if identity is None:
+        return await send_json(send, 401, {
+            'detail': 'Учетные данные не были предоставлены.'
+        })
+    user, author_ids = identity
+
+    listener = recipe_events.listen(user.id, author_ids)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Иначе nginx копит ответ в буфере.
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {RETRY_MS}\n\n'.encode(),
+            'more_body': True,
+        })
+        writer = asyncio.ensure_future(write_events(listener, send))
+        disconnect = asyncio.ensure_future(wait_disconnect(receive))
+        await asyncio.wait(
+            (writer, disconnect), return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in (writer, disconnect):
+            task.cancel()
+        await asyncio.gather(writer, disconnect, return_exceptions=True)
+    finally:
+        recipe_events.forget(listener)
+
+
+async def write_events(listener, send):
+    """
+    Отдает накопленные события одной порцией. send ждет, пока сервер
+    отправит данные клиенту, поэтому медленный клиент упирается
+    в лимит очереди, а не раздувает буферы сервера.
+    Без событий раз в RECIPE_STREAM_HEARTBEAT секунд отправляется
+    комментарий, чтобы прокси не закрыли соединение.
+    """
+    while True:
+        events, overflowed = await listener.wait(
+            settings.RECIPE_STREAM_HEARTBEAT
+        )
+        if overflowed:
+            events.insert(0, OVERFLOW)
+        await send({
+            'type': 'http.response.body',
+            'body': b''.join(events) or HEARTBEAT,
+            'more_body': True,
+        })
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
@@ -0,0 +1,205 @@
+"""
+Общий набор данных для тестов API.
+"""
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes import feed, shopping_list
+from recipes.images import image_pipeline
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Favorite, Ingredient, IngredientsToRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+PNG_1X1 = (
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk'
+    '+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+IMAGE = 'data:image/png;base64,' + PNG_1X1
+
+
+class TemporaryMediaMixin:
+    """
+    Файлы, которые пишут тесты (изображения, индекс ингредиентов,
+    PDF списков покупок), попадают во временный каталог, удаляемый
+    после тестов класса.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(
+            MEDIA_ROOT=media_root,
+            INGREDIENT_INDEX_PATH=os.path.join(
+                media_root, 'ingredient_index.bin'
+            ),
+            SHOPPING_LIST_PDF_DIR=os.path.join(media_root, 'shopping_lists'),
+        )
+        media.enable()
+        cls.addClassCleanup(media.disable)
+
+
+class Dataset:
+    """
+    Набор данных для одного прогона: scale авторов по scale рецептов,
+    в каждом рецепте scale ингредиентов и scale тегов. Читатель подписан
+    на всех авторов, их рецепты разложены по его ленте, scale рецептов
+    у него в избранном и в корзине.
+    """
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.tags = Tag.objects.bulk_create(
+            Tag(name=f'tag{i}', color=f'#{i:06X}', slug=f'tag{i}')
+            for i in range(scale)
+        )
+        self.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient{i}', measurement_unit='г')
+            for i in range(scale * 2)
+        )
+        ingredient_index.build()
+        self.reader = self.create_user('reader')
+        self.authors = [
+            self.create_user(f'author{i}') for i in range(scale)
+        ]
+        self.strangers = [
+            self.create_user(f'stranger{i}') for i in range(scale)
+        ]
+        self.recipes = Recipe.objects.bulk_create(
+            Recipe(
+                name=f'recipe{i}',
+                text='text',
+                cooking_time=10,
+                image='recipes/media/budget.png',
+                author=author,
+            )
+            for author in self.authors
+            for i in range(scale)
+        )
+        self.own_recipe = Recipe.objects.create(
+            name='own',
+            text='text',
+            cooking_time=10,
+            image='recipes/media/budget.png',
+            author=self.reader,
+        )
+        recipes = self.recipes + [self.own_recipe]
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in self.tags
+        )
+        IngredientsToRecipe.objects.bulk_create(
+            IngredientsToRecipe(
+                recipe=recipe,
+                ingredient=self.ingredients[j],
+                amount=j + 1,
+            )
+            for recipe in recipes
+            for j in range(scale)
+        )
+        marked = self.recipes[:scale]
+        Favorite.objects.bulk_create(
+            Favorite(user=self.reader, recipe=recipe) for recipe in marked
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.reader, recipe=recipe) for recipe in marked
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=self.reader, author=author)
+            for author in self.authors
+        )
+        shopping_list.rebuild()
+        feed.rebuild()
+        self.unmarked = self.recipes[-1]
+
+    @staticmethod
+    def create_user(username):
+        return User.objects.create_user(
+            username=username,
+            email=f'{username}@foodgram.local',
+            password='password',
+        )
+
+    def recipe_payload(self):
+        return {
+            'name': 'new recipe',
+            'text': 'text',
+            'cooking_time': 5,
+            'image': IMAGE,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 2}
+                for ingredient in self.ingredients[-self.scale:]
+            ],
+        }
+
+
+class DatasetSetUpMixin(TemporaryMediaMixin):
+    """
+    Перед каждым тестом - Dataset(scale) и клиент API, вошедший
+    под читателем. Постановка задач в фоновые пулы (варианты
+    изображений, раскладка лент) подменяется, если patch_pipelines:
+    их потоки работали бы с БД вне транзакции теста и пережили бы
+    ее откат.
+    """
+    scale = 2
+    patch_pipelines = True
+
+    def setUp(self):
+        super().setUp()
+        if self.patch_pipelines:
+            for pipeline in (image_pipeline, feed.feed_pipeline):
+                patcher = mock.patch.object(pipeline, 'schedule')
+                patcher.start()
+                self.addCleanup(patcher.stop)
+        self.dataset = Dataset(self.scale)
+        self.client = APIClient()
+        self.client.force_authenticate(self.dataset.reader)
+
+
+@override_settings(
+    DEBUG=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class DatasetTestCase(DatasetSetUpMixin, TestCase):
+    """
+    Тест в транзакции, которая откатывается после него.
+    """
+
+
+@override_settings(
+    DEBUG=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class DatasetTransactionTestCase(DatasetSetUpMixin, TransactionTestCase):
+    """
+    Для тестов, где транзакции фиксируются по-настоящему
+    и срабатывает on_commit.
+    """
+
+
+def read_stream(response):
+    """
+    Тестовый клиент не читает StreamingHttpResponse сам.
+    """
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def remember_etag(url):
+    """
+    Запрашивает url и дальше шлет полученный ETag в If-None-Match.
+    """
+    def prepare(client, dataset):
+        etag = client.get(url)['ETag']
+        client.credentials(HTTP_IF_NONE_MATCH=etag)
+    return prepare
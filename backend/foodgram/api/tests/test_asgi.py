@@ -0,0 +1,162 @@
+"""
+Проверки ASGI-приложения foodgram/asgi.py целиком: поток событий
+о новых рецептах (api/streams.py) и представления Django под ASGI.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from rest_framework.authtoken.models import Token
+
+from api.streams import STREAM_PATH
+from foodgram.asgi import application
+from recipes.models import Recipe
+
+from .dataset import DatasetTransactionTestCase
+
+SCALE = 2
+TIMEOUT = 5
+
+
+class ASGIRequest:
+    """
+    Запрос к ASGI-приложению в цикле событий теста. Ответ копится
+    в status и body по мере отправки; disconnect() сообщает
+    приложению, что клиент закрыл соединение.
+    """
+
+    def __init__(self, path, query_string='', token=None, method='GET'):
+        headers = [(b'host', b'testserver')]
+        if token:
+            headers.append((b'authorization', f'Token {token}'.encode()))
+        self.scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+        self.incoming = asyncio.Queue()
+        self.incoming.put_nowait(
+            {'type': 'http.request', 'body': b'', 'more_body': False}
+        )
+        self.status = None
+        self.body = b''
+        self.updated = asyncio.Event()
+        self.task = asyncio.ensure_future(
+            application(self.scope, self.incoming.get, self.send)
+        )
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        else:
+            self.body += message.get('body', b'')
+        self.updated.set()
+
+    async def wait_for(self, data):
+        """
+        Ждет, пока в теле ответа появится data.
+        """
+        while data not in self.body:
+            self.updated.clear()
+            await asyncio.wait_for(self.updated.wait(), TIMEOUT)
+
+    async def finish(self):
+        await asyncio.wait_for(self.task, TIMEOUT)
+        return self
+
+    async def disconnect(self):
+        self.incoming.put_nowait({'type': 'http.disconnect'})
+        return await self.finish()
+
+
+class ASGIApplicationTests(DatasetTransactionTestCase):
+    """
+    Запросы проходят через foodgram.asgi.application так же, как
+    под uvicorn. Данные фиксируются по-настоящему: представления
+    Django под ASGI выполняются в отдельных потоках.
+    """
+
+    scale = SCALE
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.dataset.reader).key
+
+    def publish(self, author):
+        return Recipe.objects.create(
+            name='new recipe',
+            text='text',
+            cooking_time=5,
+            image='recipes/media/budget.png',
+            author=author,
+        )
+
+    async def get_ticket(self):
+        response = await ASGIRequest(
+            '/api/recipes/stream/ticket/', token=self.token, method='POST'
+        ).finish()
+        self.assertEqual(response.status, 200)
+        return json.loads(response.body)['ticket']
+
+    async def test_download_shopping_cart(self):
+        for export_format in ('txt', 'csv'):
+            with self.subTest(export_format):
+                response = await ASGIRequest(
+                    '/api/recipes/download_shopping_cart/',
+                    f'format={export_format}',
+                    token=self.token,
+                ).finish()
+                self.assertEqual(response.status, 200)
+                self.assertIn(
+                    self.dataset.ingredients[0].name.encode(), response.body
+                )
+
+    async def test_stream_with_ticket(self):
+        ticket = await self.get_ticket()
+        stream = ASGIRequest(STREAM_PATH, f'ticket={ticket}')
+        await stream.wait_for(b'retry:')
+        self.assertEqual(stream.status, 200)
+
+        stranger = self.dataset.strangers[0]
+        ignored = await sync_to_async(self.publish)(stranger)
+        followed = await sync_to_async(self.publish)(self.dataset.authors[0])
+        await stream.wait_for(f'"id": {followed.id}'.encode())
+        self.assertNotIn(f'"id": {ignored.id}'.encode(), stream.body)
+        await stream.disconnect()
+
+    async def test_stream_with_token(self):
+        stream = ASGIRequest(STREAM_PATH, token=self.token)
+        await stream.wait_for(b'retry:')
+        self.assertEqual(stream.status, 200)
+        await stream.disconnect()
+
+    async def test_stream_rejects_bad_credentials(self):
+        ticket = await self.get_ticket()
+        for name, query_string, token in (
+            ('anonymous', '', None),
+            ('bad token', '', 'bad'),
+            ('bad ticket', 'ticket=bad', None),
+            ('forged ticket', f'ticket={ticket[:-1]}', None),
+        ):
+            with self.subTest(name):
+                response = await ASGIRequest(
+                    STREAM_PATH, query_string, token
+                ).finish()
+                self.assertEqual(response.status, 401)
+
+    async def test_stream_rejects_expired_ticket(self):
+        ticket = await self.get_ticket()
+        with self.settings(RECIPE_STREAM_TICKET_TTL=-1):
+            response = await ASGIRequest(
+                STREAM_PATH, f'ticket={ticket}'
+            ).finish()
+        self.assertEqual(response.status, 401)
@@ -0,0 +1,26 @@
+from django.test import SimpleTestCase
+
+from recipes.background import BackgroundTask
+
+
+def task(value):
+    if value is None:
+        raise ValueError(value)
+
+
+class BackgroundTaskTests(SimpleTestCase):
+    """
+    Общий фоновый пул: ленивый запуск и ошибки задач только в логе.
+    """
+
+    def test_lazy_executor_and_logged_errors(self):
+        pipeline = BackgroundTask(task, 1, 'test', 'Задача %s упала')
+        self.assertIsNone(pipeline.executor)
+        self.assertTrue(pipeline.schedule(1).result())
+        executor = pipeline.executor
+        self.assertIsNotNone(executor)
+        with self.assertLogs(__name__, 'ERROR') as logs:
+            self.assertFalse(pipeline.schedule(None).result())
+        self.assertIn('Задача None упала', logs.output[0])
+        self.assertIs(pipeline.get_executor(), executor)
+        executor.shutdown()
@@ -0,0 +1,92 @@
+from django.core.cache import cache
+
+from api.pagination import CachedCount
+from recipes.models import Favorite, Recipe, Tag
+
+from .dataset import DatasetTestCase
+
+SCALE = 2
+
+
+class CachedCountTests(DatasetTestCase):
+    """
+    Закешированный count списка рецептов меняется вместе с данными.
+    Изменения делаются внутри captureOnCommitCallbacks: поколения
+    увеличиваются после фиксации транзакции.
+    """
+
+    scale = SCALE
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.recipe = self.dataset.recipes[0]
+
+    def count(self, query=''):
+        response = self.client.get(f'/api/recipes/?limit=1&{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['count']
+
+    def assertCountChanges(self, query, change, delta):
+        """
+        Запрос с query сначала кладет count в кеш, после change
+        count отличается на delta.
+        """
+        before = self.count(query)
+        self.assertEqual(self.count(query), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(self.count(query), before + delta)
+
+    def test_recipe_create(self):
+        self.assertCountChanges('', lambda: Recipe.objects.create(
+            name='new recipe',
+            text='text',
+            cooking_time=5,
+            image='recipes/media/budget.png',
+            author=self.dataset.authors[0],
+        ), 1)
+
+    def test_recipe_delete(self):
+        self.assertCountChanges('', self.recipe.delete, -1)
+
+    def test_author_delete_cascades(self):
+        self.assertCountChanges(
+            '', self.dataset.authors[0].delete, -SCALE
+        )
+
+    def test_favorite_add_and_remove(self):
+        recipe = self.dataset.unmarked
+        self.assertCountChanges(
+            'is_favorited=1',
+            lambda: self.client.post(f'/api/recipes/{recipe.id}/favorite/'),
+            1,
+        )
+        self.assertCountChanges(
+            'is_favorited=1',
+            lambda: Favorite.objects.filter(recipe=recipe).delete(),
+            -1,
+        )
+
+    def test_tag_edits(self):
+        tag = self.dataset.tags[0]
+        query = f'tags={tag.slug}'
+        self.assertCountChanges(
+            query, lambda: self.recipe.tags.remove(tag), -1
+        )
+        self.assertCountChanges(
+            query, lambda: self.recipe.tags.add(tag), 1
+        )
+        self.assertCountChanges(query, self.recipe.tags.clear, -1)
+        tagged = self.count(query)
+        self.assertCountChanges(
+            query, lambda: tag.recipe_set.set([self.recipe]), 1 - tagged
+        )
+
+    def test_tag_delete_cascades(self):
+        tag = self.dataset.tags[0]
+        key = CachedCount.generation_key(Tag)
+        before = cache.get(key, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+        self.assertEqual(cache.get(key), before + 1)
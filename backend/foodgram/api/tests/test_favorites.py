@@ -0,0 +1,98 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from recipes.models import Favorite, Recipe
+
+from .dataset import DatasetTestCase
+
+SCALE = 2
+
+
+class FavoritedCountTests(DatasetTestCase):
+    """
+    Recipe.favorited_count следует за таблицей избранного,
+    recount_favorites чинит расхождения.
+    """
+
+    scale = SCALE
+
+    def setUp(self):
+        super().setUp()
+        # Dataset создает избранное через bulk_create, без сигналов.
+        self.recount()
+
+    @staticmethod
+    def recount():
+        call_command('recount_favorites', batch_size=2, stdout=StringIO())
+
+    @staticmethod
+    def counters():
+        return dict(Recipe.objects.values_list('id', 'favorited_count'))
+
+    @staticmethod
+    def expected():
+        counts = dict.fromkeys(
+            Recipe.objects.values_list('id', flat=True), 0
+        )
+        for recipe_id in Favorite.objects.values_list('recipe_id', flat=True):
+            counts[recipe_id] += 1
+        return counts
+
+    def assertCountersMatch(self):
+        self.assertEqual(self.counters(), self.expected())
+
+    def test_recount_matches_favorites(self):
+        self.assertEqual(
+            self.counters()[self.dataset.recipes[0].id], 1
+        )
+        self.assertCountersMatch()
+
+    def test_add_and_remove(self):
+        recipe = self.dataset.unmarked
+        response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 200)
+        Favorite.objects.create(user=self.dataset.strangers[0], recipe=recipe)
+        self.assertEqual(self.counters()[recipe.id], 2)
+        self.assertCountersMatch()
+
+        response = self.client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.counters()[recipe.id], 1)
+        self.assertCountersMatch()
+
+    def test_user_delete_cascades(self):
+        stranger = self.dataset.strangers[0]
+        for recipe in self.dataset.recipes[:SCALE]:
+            Favorite.objects.create(user=stranger, recipe=recipe)
+        self.assertEqual(self.counters()[self.dataset.recipes[0].id], 2)
+        stranger.delete()
+        self.assertEqual(self.counters()[self.dataset.recipes[0].id], 1)
+        self.assertCountersMatch()
+
+    def test_recipe_delete_cascades(self):
+        recipe = self.dataset.recipes[0]
+        recipe.delete()
+        self.assertFalse(
+            Favorite.objects.filter(recipe_id=recipe.id).exists()
+        )
+        self.assertCountersMatch()
+
+    def test_author_delete_cascades(self):
+        author = self.dataset.authors[0]
+        Favorite.objects.create(
+            user=author, recipe=self.dataset.recipes[-1]
+        )
+        author.delete()
+        self.assertCountersMatch()
+
+    def test_recount_repairs_corrupted_counters(self):
+        Recipe.objects.filter(id=self.dataset.recipes[0].id).update(
+            favorited_count=100
+        )
+        Recipe.objects.filter(id=self.dataset.recipes[1].id).update(
+            favorited_count=0
+        )
+        self.assertNotEqual(self.counters(), self.expected())
+        self.recount()
+        self.assertCountersMatch()
@@ -0,0 +1,74 @@
+import io
+import json
+from base64 import b64encode
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import ExifTags, Image
+
+from recipes.models import Recipe
+
+from .dataset import DatasetTestCase
+
+SCALE = 2
+SIZE = (40, 20)
+
+
+def photo(image_format):
+    """
+    Снимок с телефона: EXIF с поворотом на 90 градусов и координатами.
+    """
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6
+    exif[ExifTags.Base.Make] = 'Phone'
+    exif[ExifTags.Base.GPSInfo] = {
+        ExifTags.GPS.GPSLatitude: (55.0, 45.0, 0.0),
+    }
+    buffer = io.BytesIO()
+    Image.new('RGB', SIZE, (200, 10, 10)).save(
+        buffer, image_format, exif=exif.tobytes()
+    )
+    return buffer.getvalue()
+
+
+class RecipeImageMetadataTests(DatasetTestCase):
+    """
+    Оригинал изображения рецепта хранится без метаданных.
+    """
+
+    scale = SCALE
+
+    def assertStoredWithoutMetadata(self, response, image_format):
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        with recipe.image.open() as file, Image.open(file) as image:
+            self.assertEqual(image.format, image_format)
+            self.assertEqual(image.size, SIZE[::-1])
+            self.assertEqual(dict(image.getexif()), {})
+            self.assertNotIn('exif', image.info)
+
+    def test_base64_upload(self):
+        for image_format, mime in (('JPEG', 'jpeg'), ('PNG', 'png')):
+            with self.subTest(image_format):
+                payload = self.dataset.recipe_payload()
+                payload['image'] = (
+                    f'data:image/{mime};base64,'
+                    + b64encode(photo(image_format)).decode()
+                )
+                response = self.client.post(
+                    '/api/recipes/', payload, format='json'
+                )
+                self.assertStoredWithoutMetadata(response, image_format)
+
+    def test_multipart_upload(self):
+        payload = self.dataset.recipe_payload()
+        del payload['image']
+        for image_format, mime in (('JPEG', 'jpeg'), ('WEBP', 'webp')):
+            with self.subTest(image_format):
+                response = self.client.post('/api/recipes/', {
+                    'data': json.dumps(payload),
+                    'image': SimpleUploadedFile(
+                        'photo', photo(image_format),
+                        content_type=f'image/{mime}'
+                    ),
+                }, format='multipart')
+                self.assertStoredWithoutMetadata(response, image_format)
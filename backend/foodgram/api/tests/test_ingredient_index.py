@@ -0,0 +1,54 @@
+import os
+from unittest import mock
+
+from django.conf import settings
+
+from recipes.ingredient_index import IngredientIndex, ingredient_index
+
+from .dataset import DatasetTestCase
+
+
+class IngredientIndexTests(DatasetTestCase):
+    """
+    Автодополнение ингредиентов: индекс не строится в запросе,
+    замененные отображения файла закрываются.
+    """
+
+    def search(self, query):
+        response = self.client.get(f'/api/ingredients/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [dict(item) for item in response.data]
+
+    def test_missing_index_falls_back_to_database(self):
+        queries = ('name=INGREDIENT1', 'search=ingr', 'name=x')
+        expected = {query: self.search(query) for query in queries}
+        self.assertTrue(expected['search=ingr'])
+
+        os.remove(settings.INGREDIENT_INDEX_PATH)
+        fresh = IngredientIndex()
+        with mock.patch('api.views.ingredient_index', fresh), \
+                mock.patch('recipes.ingredient_search.ingredient_index',
+                           fresh):
+            for query in queries:
+                with self.subTest(query):
+                    self.assertEqual(self.search(query), expected[query])
+            fuzzy = self.search('name=ingredeint&fuzzy=1')
+        self.assertTrue(fuzzy)
+        self.assertFalse(os.path.exists(settings.INGREDIENT_INDEX_PATH))
+
+    def test_replaced_mapping_is_closed_on_next_swap(self):
+        index = IngredientIndex(check_interval=0)
+        first = index.open()
+        ingredient_index.build()
+        second = index.open()
+        self.assertIsNot(second, first)
+        self.assertFalse(first.closed)
+        self.assertEqual(
+            len(list(index.items())), len(self.dataset.ingredients)
+        )
+
+        ingredient_index.build()
+        third = index.open()
+        self.assertIsNot(third, second)
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
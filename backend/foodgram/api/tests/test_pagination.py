@@ -0,0 +1,126 @@
+import json
+from base64 import urlsafe_b64encode
+
+from recipes.models import Recipe
+
+from .dataset import DatasetTestCase
+
+SCALE = 3
+PAGE_SIZE = 4
+
+
+def encode_cursor(position, reverse=False):
+    return urlsafe_b64encode(
+        json.dumps({'r': reverse, 'p': position}).encode()
+    ).decode('ascii')
+
+
+class KeysetPaginationTests(DatasetTestCase):
+    """
+    Курсорная пагинация рецептов, подписок и ленты.
+    """
+
+    scale = SCALE
+
+    def setUp(self):
+        super().setUp()
+        self.expected = list(
+            Recipe.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    @staticmethod
+    def ids(page):
+        return [recipe['id'] for recipe in page['results']]
+
+    def walk(self, url):
+        """
+        Проходит все страницы по ссылкам next, возвращает страницы.
+        """
+        pages = [self.get_page(url)]
+        while pages[-1]['next']:
+            pages.append(self.get_page(pages[-1]['next']))
+        return pages
+
+    def publish(self):
+        return Recipe.objects.create(
+            name='new recipe',
+            text='text',
+            cooking_time=5,
+            image='recipes/media/budget.png',
+            author=self.dataset.authors[0],
+        )
+
+    def test_next_pages_cover_all_recipes_once(self):
+        pages = self.walk(f'/api/recipes/?limit={PAGE_SIZE}&cursor=')
+        self.assertEqual(
+            [recipe_id for page in pages for recipe_id in self.ids(page)],
+            self.expected,
+        )
+        self.assertIsNone(pages[0]['previous'])
+        self.assertIsNone(pages[-1]['next'])
+
+    def test_previous_pages_return_the_same_pages(self):
+        pages = self.walk(f'/api/recipes/?limit={PAGE_SIZE}&cursor=')
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.get_page(page['previous'])
+            self.assertEqual(self.ids(page), self.ids(expected))
+        self.assertIsNone(page['previous'])
+
+    def test_pages_are_stable_across_inserts(self):
+        first = self.get_page(f'/api/recipes/?limit={PAGE_SIZE}&cursor=')
+        new_recipe = self.publish()
+        pages = [first] + self.walk(first['next'])
+        seen = [recipe_id for page in pages for recipe_id in self.ids(page)]
+        self.assertEqual(seen, self.expected)
+        self.assertNotIn(new_recipe.id, seen)
+
+        previous = self.get_page(pages[1]['previous'])
+        self.assertEqual(self.ids(previous), self.ids(first))
+        newer = self.get_page(previous['previous'])
+        self.assertEqual(self.ids(newer), [new_recipe.id])
+
+    def test_subscriptions_pages(self):
+        pages = self.walk('/api/users/subscriptions/?limit=2&cursor=')
+        self.assertEqual(
+            [user['id'] for page in pages for user in page['results']],
+            list(
+                self.dataset.reader.followers
+                .order_by('-username', '-id')
+                .values_list('id', flat=True)
+            ),
+        )
+
+    def test_malformed_cursor(self):
+        recipe = Recipe.objects.get(id=self.expected[0])
+        pub_date = recipe.pub_date.isoformat()
+        common = {
+            'not base64': '!!!',
+            'not json': urlsafe_b64encode(b'cursor').decode('ascii'),
+            'not object': encode_cursor([pub_date, recipe.id])[:-2],
+            'no position': urlsafe_b64encode(b'{"r": false}').decode(),
+            'short position': encode_cursor([pub_date]),
+            'null id': encode_cursor([pub_date, None]),
+            'object id': encode_cursor([pub_date, {'id': 1}]),
+            'bad id': encode_cursor([pub_date, 'abc']),
+        }
+        by_date = {
+            **common,
+            'bad date': encode_cursor(['yesterday', recipe.id]),
+            'list date': encode_cursor([[pub_date], recipe.id]),
+        }
+        for url, cursors in (
+            ('/api/recipes/?cursor=', by_date),
+            ('/api/recipes/feed/?cursor=', by_date),
+            ('/api/users/subscriptions/?cursor=', common),
+        ):
+            for name, cursor in cursors.items():
+                with self.subTest(url=url, cursor=name):
+                    response = self.client.get(url + cursor)
+                    self.assertEqual(response.status_code, 404)
@@ -0,0 +1,305 @@
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes import feed
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription, User
+
+from .dataset import Dataset, TemporaryMediaMixin, read_stream, remember_etag
+
+SMALL_SCALE = 3
+LARGE_SCALE = 12
+SIGNUP = {
+    'username': 'newcomer',
+    'email': 'newcomer@foodgram.local',
+    'password': 'password',
+    'first_name': 'New',
+    'last_name': 'Comer',
+}
+
+
+@dataclass
+class Budget:
+    """
+    Бюджет запросов к БД для одного эндпоинта.
+    prepare(client, dataset) выполняется перед замером и в бюджет
+    не входит.
+    """
+    name: str
+    call: Callable
+    queries: int
+    status: int = 200
+    prepare: Optional[Callable] = None
+
+
+def share_own_recipe(client, dataset):
+    """
+    Рецепт читателя в избранном и корзинах всех посторонних, они
+    подписаны на читателя: удаление рецепта задевает счетчик
+    избранного, итоги списков покупок и ленты.
+    """
+    recipe = dataset.own_recipe
+    for user in dataset.strangers:
+        Subscription.objects.create(user=user, author=dataset.reader)
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=dataset.reader, recipe=recipe)
+    feed.rebuild()
+
+
+# Удаление рецепта вычитает его из всех корзин одним пересчетом
+# (recipes/signals.py), поэтому не растет с числом корзин.
+# Сброс счетчиков по m2m_changed (CachedCount в api/pagination.py)
+# выключает быстрое добавление тегов: Django сначала читает уже
+# связанные теги, это еще один запрос при создании рецепта.
+# На холодном кеше справочникам нужен еще один запрос - версия для ETag
+# (см. recipes/catalog.py); затем она CATALOG_VERSION_TTL секунд
+# берется из кеша.
+BUDGETS = (
+    Budget(
+        'recipes-list',
+        lambda c, d: c.get(f'/api/recipes/?limit={d.scale}'),
+        queries=5,
+    ),
+    Budget(
+        'recipes-list-cursor',
+        lambda c, d: c.get(f'/api/recipes/?limit={d.scale}&cursor='),
+        queries=4,
+    ),
+    Budget(
+        'recipes-detail',
+        lambda c, d: c.get(f'/api/recipes/{d.recipes[0].id}/'),
+        queries=4,
+    ),
+    Budget(
+        'recipes-create',
+        lambda c, d: c.post('/api/recipes/', d.recipe_payload(),
+                            format='json'),
+        queries=14,
+        status=201,
+    ),
+    Budget(
+        'recipes-update',
+        lambda c, d: c.patch(f'/api/recipes/{d.own_recipe.id}/',
+                             d.recipe_payload(), format='json'),
+        queries=18,
+    ),
+    Budget(
+        'recipes-delete',
+        lambda c, d: c.delete(f'/api/recipes/{d.own_recipe.id}/'),
+        queries=17,
+        status=204,
+        prepare=share_own_recipe,
+    ),
+    Budget(
+        'recipes-feed',
+        lambda c, d: c.get(f'/api/recipes/feed/?limit={d.scale}'),
+        queries=6,
+    ),
+    Budget(
+        'recipes-feed-fanout-on-read',
+        lambda c, d: c.get(f'/api/recipes/feed/?limit={d.scale}'),
+        queries=7,
+        prepare=lambda c, d: User.objects.filter(
+            id=d.authors[0].id
+        ).update(fanout_on_read=True),
+    ),
+    Budget(
+        'recipes-favorite-add',
+        lambda c, d: c.post(f'/api/recipes/{d.unmarked.id}/favorite/'),
+        queries=7,
+    ),
+    Budget(
+        'recipes-favorite-delete',
+        lambda c, d: c.delete(f'/api/recipes/{d.recipes[0].id}/favorite/'),
+        queries=4,
+        status=204,
+    ),
+    Budget(
+        'recipes-shopping-cart-add',
+        lambda c, d: c.post(f'/api/recipes/{d.unmarked.id}/shopping_cart/'),
+        queries=11,
+    ),
+    Budget(
+        'recipes-shopping-cart-delete',
+        lambda c, d: c.delete(
+            f'/api/recipes/{d.recipes[0].id}/shopping_cart/'
+        ),
+        queries=8,
+        status=204,
+    ),
+    Budget(
+        'recipes-download-shopping-cart',
+        lambda c, d: read_stream(
+            c.get('/api/recipes/download_shopping_cart/')
+        ),
+        queries=2,
+    ),
+    Budget(
+        'recipes-download-shopping-cart-csv',
+        lambda c, d: read_stream(
+            c.get('/api/recipes/download_shopping_cart/?format=csv')
+        ),
+        queries=2,
+    ),
+    Budget(
+        'recipes-stream-ticket',
+        lambda c, d: c.post('/api/recipes/stream/ticket/'),
+        queries=0,
+    ),
+    Budget(
+        'tags-list',
+        lambda c, d: c.get('/api/tags/'),
+        queries=2,
+    ),
+    Budget(
+        'tags-detail',
+        lambda c, d: c.get(f'/api/tags/{d.tags[0].slug}/'),
+        queries=2,
+    ),
+    Budget(
+        'tags-list-not-modified',
+        lambda c, d: c.get('/api/tags/'),
+        queries=0,
+        status=304,
+        prepare=remember_etag('/api/tags/'),
+    ),
+    Budget(
+        'ingredients-list',
+        lambda c, d: c.get('/api/ingredients/'),
+        queries=2,
+    ),
+    Budget(
+        'ingredients-list-not-modified',
+        lambda c, d: c.get('/api/ingredients/'),
+        queries=0,
+        status=304,
+        prepare=remember_etag('/api/ingredients/'),
+    ),
+    Budget(
+        'ingredients-search',
+        lambda c, d: c.get('/api/ingredients/?name=ingr'),
+        queries=1,
+    ),
+    Budget(
+        'ingredients-fuzzy-search',
+        lambda c, d: c.get('/api/ingredients/?name=ingredeint&fuzzy=1'),
+        queries=1,
+    ),
+    Budget(
+        'users-list',
+        lambda c, d: c.get(f'/api/users/?limit={d.scale}'),
+        queries=3,
+    ),
+    Budget(
+        'users-detail',
+        lambda c, d: c.get(f'/api/users/{d.authors[0].id}/'),
+        queries=2,
+    ),
+    Budget(
+        'users-me',
+        lambda c, d: c.get('/api/users/me/'),
+        queries=1,
+    ),
+    Budget(
+        'users-signup',
+        lambda c, d: c.post('/api/users/', SIGNUP, format='json'),
+        queries=7,
+        status=201,
+    ),
+    Budget(
+        'users-set-password',
+        lambda c, d: c.post('/api/users/set_password/', {
+            'new_password': 'new-password',
+            'current_password': 'password',
+        }, format='json'),
+        queries=3,
+    ),
+    Budget(
+        'users-subscriptions',
+        lambda c, d: c.get(
+            f'/api/users/subscriptions/?limit={d.scale}'
+            f'&recipes_limit={d.scale}'
+        ),
+        queries=3,
+    ),
+    Budget(
+        'users-subscriptions-cursor',
+        lambda c, d: c.get(
+            f'/api/users/subscriptions/?limit={d.scale}'
+            f'&recipes_limit={d.scale}&cursor='
+        ),
+        queries=2,
+    ),
+    Budget(
+        'users-subscribe',
+        lambda c, d: c.post(f'/api/users/{d.strangers[0].id}/subscribe/'),
+        queries=7,
+    ),
+    Budget(
+        'users-unsubscribe',
+        lambda c, d: c.delete(f'/api/users/{d.authors[0].id}/subscribe/'),
+        queries=2,
+        status=204,
+    ),
+    Budget(
+        'auth-token-login',
+        lambda c, d: c.post('/api/auth/token/login/', {
+            'email': d.reader.email,
+            'password': 'password',
+        }, format='json'),
+        queries=5,
+    ),
+    Budget(
+        'auth-token-logout',
+        lambda c, d: c.post('/api/auth/token/logout/'),
+        queries=3,
+        status=204,
+        prepare=lambda c, d: Token.objects.create(user=d.reader),
+    ),
+)
+
+
+@override_settings(
+    DEBUG=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryBudgetTests(TemporaryMediaMixin, TestCase):
+    """
+    Каждый эндпоинт API укладывается в свой бюджет запросов к БД,
+    и число запросов не растет вместе с размером страницы
+    и количеством связанных записей.
+    """
+
+    def test_budgets(self):
+        for budget in BUDGETS:
+            with self.subTest(budget.name):
+                small = self.measure(budget, SMALL_SCALE)
+                large = self.measure(budget, LARGE_SCALE)
+                self.assertLessEqual(large, budget.queries)
+                self.assertEqual(small, large)
+
+    def measure(self, budget, scale):
+        """
+        Число запросов эндпоинта на наборе данных размера scale.
+        Данные откатываются после замера, кеш очищается.
+        """
+        cache.clear()
+        with transaction.atomic():
+            dataset = Dataset(scale)
+            client = APIClient()
+            client.force_authenticate(dataset.reader)
+            if budget.prepare:
+                budget.prepare(client, dataset)
+            with CaptureQueriesContext(connection) as queries:
+                response = budget.call(client, dataset)
+            transaction.set_rollback(True)
+        self.assertEqual(response.status_code, budget.status)
+        return len(queries)
@@ -0,0 +1,109 @@
+from recipes.models import IngredientsToRecipe, Recipe
+
+from .dataset import DatasetTestCase
+
+SCALE = 3
+
+
+class RecipeWriteTests(DatasetTestCase):
+    """
+    Запись ингредиентов и тегов рецепта: разница с текущим составом
+    и проверка id одним запросом на список.
+    """
+
+    scale = SCALE
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.dataset.own_recipe
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def lines(self):
+        return dict(
+            IngredientsToRecipe.objects.filter(recipe=self.recipe)
+            .values_list('ingredient_id', 'amount')
+        )
+
+    def line_ids(self):
+        return dict(
+            IngredientsToRecipe.objects.filter(recipe=self.recipe)
+            .values_list('ingredient_id', 'id')
+        )
+
+    def test_update_adds_changes_and_removes_lines(self):
+        ingredients = self.dataset.ingredients
+        # Сейчас в рецепте ingredients[0..2] с количеством 1, 2, 3.
+        kept, changed, removed = ingredients[:SCALE]
+        added = ingredients[-1]
+        ids_before = self.line_ids()
+        payload = self.dataset.recipe_payload()
+        payload['ingredients'] = [
+            {'id': kept.id, 'amount': 1},
+            {'id': changed.id, 'amount': 20},
+            {'id': added.id, 'amount': 5},
+        ]
+        payload['tags'] = [self.dataset.tags[0].id]
+
+        response = self.client.patch(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            self.lines(), {kept.id: 1, changed.id: 20, added.id: 5}
+        )
+        ids_after = self.line_ids()
+        self.assertEqual(ids_after[kept.id], ids_before[kept.id])
+        self.assertEqual(ids_after[changed.id], ids_before[changed.id])
+        self.assertNotIn(removed.id, ids_after)
+        self.assertEqual(
+            list(self.recipe.tags.values_list('id', flat=True)),
+            [self.dataset.tags[0].id],
+        )
+        self.assertEqual(
+            sorted(
+                (line['id'], line['amount'])
+                for line in response.data['ingredients']
+            ),
+            sorted([(kept.id, 1), (changed.id, 20), (added.id, 5)]),
+        )
+
+    def test_rejected_ids(self):
+        ingredient = self.dataset.ingredients[0]
+        tag = self.dataset.tags[0]
+        unknown = max(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)[0],
+            ingredient.id, tag.id,
+        ) + 1000
+        cases = {
+            'duplicate ingredient': ('ingredients', [
+                {'id': ingredient.id, 'amount': 1},
+                {'id': ingredient.id, 'amount': 2},
+            ]),
+            'unknown ingredient': ('ingredients', [
+                {'id': ingredient.id, 'amount': 1},
+                {'id': unknown, 'amount': 2},
+            ]),
+            'malformed ingredient': ('ingredients', [
+                {'id': 'abc', 'amount': 1},
+            ]),
+            'out of range ingredient': ('ingredients', [
+                {'id': 2 ** 70, 'amount': 1},
+            ]),
+            'duplicate tag': ('tags', [tag.id, tag.id]),
+            'unknown tag': ('tags', [tag.id, unknown]),
+            'malformed tag': ('tags', [True]),
+            'out of range tag': ('tags', [2 ** 70]),
+        }
+        lines = self.lines()
+        for name, (field, value) in cases.items():
+            for method in ('post', 'patch'):
+                with self.subTest(name, method=method):
+                    payload = self.dataset.recipe_payload()
+                    payload[field] = value
+                    url = '/api/recipes/' if method == 'post' else self.url
+                    response = getattr(self.client, method)(
+                        url, payload, format='json'
+                    )
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(field, response.data)
+        self.assertEqual(self.lines(), lines)
+        self.assertEqual(Recipe.objects.filter(name='new recipe').count(), 0)
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.db.models import Sum
+
+from api.shopping_list import pdf_pool
+from recipes import shopping_list
+from recipes.models import (IngredientsToRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem)
+
+from .dataset import DatasetTestCase, read_stream
+
+SCALE = 2
+PDF_URL = '/api/recipes/download_shopping_cart/?format=pdf'
+PDF_TIMEOUT = 30
+
+
+class ShoppingListPdfTests(DatasetTestCase):
+    """
+    PDF собирается в фоне: первый запрос получает 202, повторные -
+    готовый файл, пока версия списка не изменилась.
+    """
+
+    scale = SCALE
+
+    def wait_for_pdf(self):
+        """
+        Повторяет запрос, пока PDF не будет готов. Тело ответа
+        прочитано в response.body.
+        """
+        deadline = time.monotonic() + PDF_TIMEOUT
+        while True:
+            response = self.client.get(PDF_URL)
+            if response.status_code != 202:
+                response.body = b''.join(response.streaming_content)
+                return response
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.1)
+
+    def test_pdf_is_rendered_in_background(self):
+        response = self.client.get(PDF_URL)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], 'http://testserver' + PDF_URL)
+        self.assertIn('Retry-After', response)
+        self.assertNotIn('ETag', response)
+
+        response = self.wait_for_pdf()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('shopping_list.pdf', response['Content-Disposition'])
+        self.assertTrue(response.body.startswith(b'%PDF'))
+
+        self.client.credentials(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(self.client.get(PDF_URL).status_code, 304)
+
+    def test_pdf_for_new_version_is_rendered_again(self):
+        self.assertEqual(self.wait_for_pdf().status_code, 200)
+        self.client.post(
+            f'/api/recipes/{self.dataset.unmarked.id}/shopping_cart/'
+        )
+        self.assertEqual(self.client.get(PDF_URL).status_code, 202)
+        self.assertEqual(self.wait_for_pdf().status_code, 200)
+        self.assertEqual(
+            os.listdir(settings.SHOPPING_LIST_PDF_DIR),
+            [os.path.basename(pdf_pool.path(
+                self.dataset.reader.id,
+                shopping_list.get_version(self.dataset.reader),
+            ))],
+        )
+
+    def test_busy_pool(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.object(pdf_pool, 'slots', slots):
+            response = self.client.get(PDF_URL)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class ShoppingListTotalsTests(DatasetTestCase):
+    """
+    Итоги ShoppingListItem после каждого изменения совпадают
+    с пересчетом с нуля, версия списка меняется вместе с ними.
+    """
+
+    scale = SCALE
+
+    def setUp(self):
+        super().setUp()
+        self.reader = self.dataset.reader
+        self.stranger = self.dataset.strangers[0]
+        ShoppingCart.objects.create(
+            user=self.stranger, recipe=self.dataset.own_recipe
+        )
+        ShoppingCart.objects.create(
+            user=self.stranger, recipe=self.dataset.recipes[0]
+        )
+
+    @staticmethod
+    def totals():
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+
+    @staticmethod
+    def recomputed():
+        return {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in (
+                IngredientsToRecipe.objects
+                .filter(recipe__shopping_cart__user__isnull=False)
+                .order_by()
+                .values_list('recipe__shopping_cart__user', 'ingredient')
+                .annotate(total=Sum('amount'))
+            )
+        }
+
+    def assertTotalsMatch(self):
+        self.assertEqual(self.totals(), self.recomputed())
+
+    def test_initial_totals(self):
+        self.assertTrue(self.totals())
+        self.assertTotalsMatch()
+
+    def test_cart_add(self):
+        recipe = self.dataset.unmarked
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTotalsMatch()
+
+    def test_cart_remove(self):
+        recipe = self.dataset.recipes[0]
+        response = self.client.delete(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotalsMatch()
+        ShoppingCart.objects.filter(user=self.stranger).delete()
+        self.assertTotalsMatch()
+
+    def test_recipe_ingredients_edit(self):
+        payload = self.dataset.recipe_payload()
+        ingredients = self.dataset.ingredients
+        payload['ingredients'] = [
+            {'id': ingredients[0].id, 'amount': 100},
+            {'id': ingredients[1].id, 'amount': 2},
+            {'id': ingredients[-1].id, 'amount': 7},
+        ]
+        response = self.client.patch(
+            f'/api/recipes/{self.dataset.own_recipe.id}/',
+            payload, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTotalsMatch()
+
+    def test_recipe_delete(self):
+        self.dataset.recipes[0].delete()
+        self.assertTotalsMatch()
+        response = self.client.delete(
+            f'/api/recipes/{self.dataset.own_recipe.id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotalsMatch()
+
+    def test_recipe_delete_by_queryset_and_author(self):
+        ShoppingCart.objects.create(
+            user=self.stranger, recipe=self.dataset.recipes[1]
+        )
+        Recipe.objects.filter(id=self.dataset.recipes[1].id).delete()
+        self.assertTotalsMatch()
+        self.dataset.authors[0].delete()
+        self.assertTotalsMatch()
+
+    def test_ingredient_delete(self):
+        self.dataset.ingredients[0].delete()
+        self.assertTotalsMatch()
+
+    def test_concurrently_created_items(self):
+        """
+        Позиции, которые одновременно создала другая транзакция,
+        после IntegrityError обновляются как существующие.
+        """
+        update_existing = shopping_list.update_existing
+        calls = []
+
+        def missed_once(deltas):
+            calls.append(deltas)
+            if len(calls) == 1:
+                return {
+                    key: delta for key, delta in deltas.items() if delta > 0
+                }
+            return update_existing(deltas)
+
+        recipe = self.dataset.recipes[1]
+        with mock.patch.object(
+            shopping_list, 'update_existing', side_effect=missed_once
+        ):
+            ShoppingCart.objects.create(user=self.stranger, recipe=recipe)
+        self.assertEqual(len(calls), 2)
+        self.assertTotalsMatch()
+
+    def test_not_modified_while_version_unchanged(self):
+        url = '/api/recipes/download_shopping_cart/'
+        etag = read_stream(self.client.get(url))['ETag']
+        self.client.credentials(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(self.client.get(url).status_code, 304)
+
+        # Избранное и чужая корзина список читателя не меняют.
+        self.client.post(
+            f'/api/recipes/{self.dataset.unmarked.id}/favorite/'
+        )
+        ShoppingCart.objects.create(
+            user=self.stranger, recipe=self.dataset.unmarked
+        )
+        self.assertEqual(self.client.get(url).status_code, 304)
+
+        own_recipe = self.dataset.own_recipe
+        for change in (
+            lambda: self.client.post(
+                f'/api/recipes/{own_recipe.id}/shopping_cart/'
+            ),
+            lambda: self.client.patch(
+                f'/api/recipes/{own_recipe.id}/',
+                self.dataset.recipe_payload(), format='json'
+            ),
+            lambda: self.dataset.ingredients[0].delete(),
+        ):
+            version = shopping_list.get_version(self.reader)
+            change()
+            self.assertGreater(shopping_list.get_version(self.reader), version)
+            response = read_stream(self.client.get(url))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+            self.client.credentials(HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(self.client.get(url).status_code, 304)
@@ -1,55 +1,166 @@
 from http import HTTPStatus
 
-from django.http import HttpResponse
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, viewsets
+from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from recipes import feed, ingredient_search, shopping_list
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (Favorite, Ingredient, IngredientsToRecipe, Recipe,
                             ShoppingCart, Tag)
+from users.models import Subscription, User
 from users.serializers import RecipeReadMinimalSerializer
 
+from .conditional import CatalogConditionalMixin
 from .filters import RecipeFilter
-from .pagination import CustomPagination
+from .pagination import (CachedCount, CustomPagination, EstimatedCount,
+                         KeysetPaginationMixin, MergedKeysetPagination)
+from .parsers import MultiPartJSONParser
 from .permissions import IsAuthorOrReadOnlyPermission
-from .renderer import PlainTextRenderer
+from .renderer import CSVRenderer, PDFRenderer, PlainTextRenderer
 from .serializers import (IngredientSerializer, RecipeReadSerializer,
                           RecipeWriteSerializer, TagSerializer)
+from .shopping_list import EXPORT_FORMATS, ExportBusy, pdf_pool
+from .streams import issue_ticket
 
+READ_ACTIONS = ('list', 'retrieve', 'feed')
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     """
     Вьюсет для работы с рецептами.
     Основные методы обеспечивают CRUD-операции,
     методы favorite и shopping_cart отвечают за добавление и удаление
     рецептов в список избранного и в список покупок.
+    С параметром ?cursor= список отдается курсорной пагинацией.
+    Рецепт можно отправить JSON-ом с изображением в base64 или
+    multipart-запросом: поля JSON-ом в части data, файл в части image.
     """
     permission_classes = (IsAuthorOrReadOnlyPermission, )
     pagination_class = CustomPagination
+    cursor_ordering = ('-pub_date', '-id')
+    count_strategy = EstimatedCount(
+        CachedCount(
+            timeout=60,
+            invalidate_on=(
+                Recipe, Recipe.tags.through, Tag, Ingredient,
+                Favorite, ShoppingCart,
+            ),
+            private_params=('is_favorited', 'is_in_shopping_cart'),
+        )
+    )
+    parser_classes = (JSONParser, MultiPartJSONParser)
     filter_backends = (DjangoFilterBackend,)
-    filterset_fields = ['author',]
     queryset = Recipe.objects.all()
     filterset_class = RecipeFilter
 
     def get_serializer_class(self):
-        if self.action == 'list' or self.action == 'retrieve':
+        if self.action in READ_ACTIONS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_queryset(self):
+        """
+        Для чтения собираем весь граф рецепта за фиксированное
+        число запросов: флаги избранного и списка покупок считаются
+        подзапросами EXISTS, автор (вместе с флагом подписки),
+        теги и ингредиенты подгружаются через prefetch.
+        """
+        queryset = super().get_queryset()
+        if self.action not in READ_ACTIONS:
+            return queryset
+        user = self.request.user
+        authors = User.objects.all()
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                is_in_shopping_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef('pk')
+                    )
+                ),
+            )
+            authors = authors.annotate(
+                is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, author=OuterRef('pk')
+                    )
+                )
+            )
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'recipe_with_ingredients',
+                queryset=IngredientsToRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
     def get_serializer_context(self):
         """
         Дополнительные данные для контекста сериализатора.
+        В списке рецептов и в ленте отдается вариант изображения
+        для карточки, на странице рецепта - крупный.
         """
         return {
             'request': self.request,
             'format': self.format_kwarg,
             'view': self,
-            'kwargs': self.kwargs
+            'kwargs': self.kwargs,
+            'image_variant': (
+                'card' if self.action in ('list', 'feed') else 'large'
+            ),
         }
 
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated, ))
+    def feed(self, request):
+        """
+        URL /recipes/feed
+        Рецепты авторов, на которых подписан пользователь, от новых
+        к старым. Лента всегда отдается курсорной пагинацией.
+        """
+        paginator = MergedKeysetPagination()
+        page = paginator.paginate_queryset(
+            feed.sources(request.user), request, view=self
+        )
+        recipe_ids = [recipe_id for _, recipe_id in page]
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = self.get_serializer(
+            [
+                recipes[recipe_id] for recipe_id in recipe_ids
+                if recipe_id in recipes
+            ],
+            many=True,
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='stream/ticket',
+        permission_classes=(IsAuthenticated, ))
+    def stream_ticket(self, request):
+        """
+        URL /recipes/stream/ticket
+        Билет для подключения к потоку /recipes/stream/?ticket=
+        из EventSource, который не умеет передавать заголовки.
+        """
+        return Response({'ticket': issue_ticket(request.user)})
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -122,64 +233,122 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=False,
         methods=['get'],
         url_path='download_shopping_cart',
-        renderer_classes=(PlainTextRenderer, ),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, PDFRenderer),
         permission_classes=(IsAuthenticated, ))
     def download_shopping_cart(self, *args, **kwargs):
         """
         URL /recipes/download_shopping_cart
-        Cкачать список покупок.
+        Cкачать список покупок в формате ?format=txt|csv|pdf.
+        Итоги по ингредиентам берутся из ShoppingListItem, файл отдается
+        потоком. Версия списка служит ETag-ом: если список не менялся,
+        отвечаем 304 без чтения итогов.
+        Итоги читаются до ответа: под ASGI тело StreamingHttpResponse
+        перебирается в цикле событий, где запросы к БД запрещены.
+        PDF собирается в фоне: пока файла для текущей версии списка
+        нет, ответ - 202 с адресом для повторного запроса в Location
+        и Retry-After, а если очередь сборки занята - 503.
         """
         user = self.request.user
-        current_cart = ShoppingCart.objects.filter(user=user)
-        cart_dict = {}
-        for obj in current_cart:
-            ingredients = IngredientsToRecipe.objects.filter(
-                recipe=obj.recipe
-            ).all()
-            for item in ingredients:
-                ingredient = get_object_or_404(
-                    Ingredient,
-                    id=item.ingredient.id
-                )
-                try:
-                    cart_dict[ingredient] += item.amount
-                except Exception:
-                    cart_dict[ingredient] = 0
-                    cart_dict[ingredient] += item.amount
-
-        result = []
-        for item in cart_dict.keys():
-            str = (
-                f'{item} : {cart_dict[item]}\n'
-            )
-            result.append(str)
+        export_format = self.request.accepted_renderer.format
+        version = shopping_list.get_version(user)
+        etag = quote_etag(f'{user.id}-{version}-{export_format}')
+        if etag in parse_etags(
+            self.request.META.get('HTTP_IF_NONE_MATCH', '')
+        ):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        ingredients = shopping_list.export_rows(user.id)
+        render, content_type = EXPORT_FORMATS[export_format]
+        if export_format == 'pdf':
+            content = pdf_pool.load(user.id, version)
+            if content is None:
+                return self.schedule_pdf(user, version, list(ingredients))
+        else:
+            content = list(ingredients)
 
-        filename = 'shopping_list.txt'
-        response = HttpResponse(
-            result, content_type='text/plain; charset=UTF-8'
+        filename = f'shopping_list.{export_format}'
+        response = StreamingHttpResponse(
+            render(content), content_type=content_type
         )
         response['Content-Disposition'] = (
             'attachment; filename={0}'.format(filename)
         )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         return response
 
+    def schedule_pdf(self, user, version, rows):
+        try:
+            pdf_pool.schedule(user.id, version, rows)
+        except ExportBusy:
+            return HttpResponse(
+                status=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '5'}
+            )
+        return HttpResponse(
+            status=HTTPStatus.ACCEPTED,
+            headers={
+                'Location': self.request.build_absolute_uri(),
+                'Retry-After': '1',
+                'Cache-Control': 'no-store',
+            }
+        )
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CatalogConditionalMixin, viewsets.ModelViewSet):
     """
     Вьюсет для работы с тегами.
     """
+    catalog_models = (Tag,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     lookup_field = 'slug'
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogConditionalMixin, viewsets.ModelViewSet):
     """
     Вьюсет для работы с ингредиентами.
+    Поиск по началу названия (?name=, для совместимости и ?search=)
+    отвечает из префиксного индекса в памяти, без запросов к БД;
+    пока индекс не построен - запросом istartswith.
+    С ?fuzzy=1 поиск терпим к опечаткам и словоформам: отдается
+    не больше limit лучших совпадений, сначала по началу названия.
     """
+    catalog_models = (Ingredient,)
     queryset = Ingredient.objects.all()
     pagination_class = None
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ['^name',]
+    search_params = ('name', 'search')
+    fuzzy_limit = 10
+    max_fuzzy_limit = 50
+
+    def list(self, request, *args, **kwargs):
+        for param in self.search_params:
+            query = request.query_params.get(param)
+            if not query:
+                continue
+            if request.query_params.get('fuzzy') in ('1', 'true'):
+                return Response(
+                    ingredient_search.search(query, self.get_fuzzy_limit())
+                )
+            items = ingredient_index.search(query)
+            if items is None:
+                # Индекс еще не построен (см. build_ingredient_index).
+                items = self.get_serializer(
+                    self.get_queryset().filter(name__istartswith=query),
+                    many=True
+                ).data
+            return Response(items)
+        return super().list(request, *args, **kwargs)
+
+    def get_fuzzy_limit(self):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            return self.fuzzy_limit
+        if limit <= 0:
+            return self.fuzzy_limit
+        return min(limit, self.max_fuzzy_limit)
@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после get_asgi_application: модулю нужны загруженные приложения.
+from api.streams import STREAM_PATH, recipe_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """
+    Поток событий о новых рецептах обслуживается в обход Django
+    (см. api/streams.py), остальные запросы - Django.
+    """
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        return await recipe_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
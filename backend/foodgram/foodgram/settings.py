@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
@@ -106,6 +107,57 @@ DATABASES = {
     }
 }
 
+# Кеш default должен быть общим для всех процессов gunicorn/uvicorn:
+# в нем хранятся поколения закешированных счетчиков страниц
+# (см. CachedCount в api/pagination.py). LocMemCache годится только
+# для разработки, manage.py check --deploy об этом предупредит.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+CATALOG_VERSION_TTL = int(os.getenv('CATALOG_VERSION_TTL', 5))
+
+# Лимиты пула PDF действуют на каждый процесс gunicorn отдельно.
+SHOPPING_LIST_PDF_WORKERS = int(os.getenv('SHOPPING_LIST_PDF_WORKERS', 1))
+SHOPPING_LIST_PDF_QUEUE = int(os.getenv('SHOPPING_LIST_PDF_QUEUE', 1))
+# Готовые PDF не должны попадать в MEDIA_ROOT: он раздается публично.
+SHOPPING_LIST_PDF_DIR = os.getenv(
+    'SHOPPING_LIST_PDF_DIR',
+    os.path.join(BASE_DIR, 'var', 'shopping_lists')
+)
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 10000)
+)
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 100))
+FEED_FANOUT_WORKERS = int(os.getenv('FEED_FANOUT_WORKERS', 1))
+
+RECIPE_STREAM_TICKET_TTL = int(os.getenv('RECIPE_STREAM_TICKET_TTL', 60))
+RECIPE_STREAM_HEARTBEAT = int(os.getenv('RECIPE_STREAM_HEARTBEAT', 15))
+RECIPE_STREAM_MAX_BUFFER = int(
+    os.getenv('RECIPE_STREAM_MAX_BUFFER', 64 * 1024)
+)
+
+INGREDIENT_INDEX_PATH = os.getenv(
+    'INGREDIENT_INDEX_PATH',
+    os.path.join(BASE_DIR, 'var', 'ingredient_index.bin')
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
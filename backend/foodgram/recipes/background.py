@@ -0,0 +1,64 @@
+"""
+Фоновые пулы исполнителей. Пул создается при первой задаче, а не
+при импорте: процессы, которым он не нужен (команды manage.py,
+воркеры без фоновой работы), не запускают лишних потоков.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+
+class BackgroundPool:
+    """
+    Лениво создаваемый executor_class(workers, **options).
+    """
+
+    def __init__(self, workers, executor_class=ThreadPoolExecutor,
+                 **options):
+        self.workers = workers
+        self.executor_class = executor_class
+        self.options = options
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = self.executor_class(
+                    self.workers, **self.options
+                )
+            return self.executor
+
+    def submit(self, fn, *args):
+        return self.get_executor().submit(fn, *args)
+
+
+class BackgroundTask(BackgroundPool):
+    """
+    Пул фоновых потоков для одной функции task: schedule(*args)
+    ставит в очередь task(*args). Ошибки только пишутся в лог модуля
+    task сообщением error_message с аргументами задачи, future тогда
+    возвращает False. После задачи поток закрывает свои соединения
+    с БД.
+    """
+
+    def __init__(self, task, workers, name, error_message):
+        super().__init__(workers, thread_name_prefix=name)
+        self.task = task
+        self.error_message = error_message
+        self.logger = logging.getLogger(task.__module__)
+
+    def schedule(self, *args):
+        return self.submit(self.run, *args)
+
+    def run(self, *args):
+        try:
+            self.task(*args)
+            return True
+        except Exception:
+            self.logger.exception(self.error_message, *args)
+            return False
+        finally:
+            connections.close_all()
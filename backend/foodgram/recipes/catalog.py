@@ -0,0 +1,54 @@
+"""
+Версии справочников (тегов и ингредиентов) для условных GET.
+Версия - случайный токен в таблице CatalogVersion, общей для всех
+процессов. Ее меняет любая транзакция, в которой объект справочника
+был сохранен или удален, и команды массовой загрузки. Чтобы ответ
+304 не стоил запроса к БД, прочитанная версия держится в кеше
+CATALOG_VERSION_TTL секунд: столько же после изменения процессы,
+кроме изменившего, могут отдавать прежний ETag.
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CatalogVersion
+
+INITIAL_VERSION = '0'
+
+
+def version_key(model):
+    return f'catalog-version:{model._meta.label}'
+
+
+def bump(model):
+    """
+    Новая версия пишется в текущей транзакции и становится видна
+    вместе с изменениями справочника.
+    """
+    label, token = model._meta.label, uuid4().hex
+    if not CatalogVersion.objects.filter(label=label).update(token=token):
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(label=label, token=token)],
+            ignore_conflicts=True,
+        )
+    transaction.on_commit(lambda: cache.delete(version_key(model)))
+
+
+def get_version(*models):
+    keys = {version_key(model): model._meta.label for model in models}
+    versions = cache.get_many(keys)
+    missing = [label for key, label in keys.items() if key not in versions]
+    if missing:
+        tokens = dict(
+            CatalogVersion.objects.filter(label__in=missing)
+            .values_list('label', 'token')
+        )
+        fetched = {
+            key: tokens.get(label, INITIAL_VERSION)
+            for key, label in keys.items() if key not in versions
+        }
+        cache.set_many(fetched, timeout=settings.CATALOG_VERSION_TTL)
+        versions.update(fetched)
+    return '.'.join(versions[key] for key in keys)
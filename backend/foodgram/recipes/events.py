@@ -0,0 +1,139 @@
+"""
+Рассылка событий о новых рецептах открытым потокам SSE
+(см. api/streams.py). Рецепты публикуются из синхронного кода
+в потоках Django, потоки SSE живут в цикле asyncio, поэтому
+события передаются в цикл через call_soon_threadsafe.
+Рассылка работает внутри одного процесса: рецепт, созданный
+в другом процессе, подписчики этого процесса не увидят.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+
+class Listener:
+    """
+    Очередь событий одного соединения. Размер очереди ограничен
+    max_buffer байтами: если клиент читает медленнее, чем приходят
+    события, очередь сбрасывается, и клиенту уходит одно событие
+    overflow вместо всех пропущенных.
+    """
+
+    def __init__(self, loop, user_id, author_ids, max_buffer):
+        self.loop = loop
+        self.user_id = user_id
+        self.author_ids = set(author_ids)
+        self.max_buffer = max_buffer
+        self.events = deque()
+        self.size = 0
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def put(self, event):
+        """
+        Вызывается только в цикле соединения.
+        """
+        if self.size + len(event) > self.max_buffer:
+            self.events.clear()
+            self.size = 0
+            self.overflowed = True
+        else:
+            self.events.append(event)
+            self.size += len(event)
+        self.ready.set()
+
+    async def wait(self, timeout):
+        """
+        Ждет событий не дольше timeout секунд. Возвращает накопленные
+        события (пустой список, если их не было) и флаг переполнения.
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.ready.clear()
+        events, self.events, self.size = list(self.events), deque(), 0
+        overflowed, self.overflowed = self.overflowed, False
+        return events, overflowed
+
+
+class RecipeBroadcaster:
+    def __init__(self, max_buffer):
+        self.max_buffer = max_buffer
+        self.lock = threading.Lock()
+        self.by_author = defaultdict(set)
+        self.by_user = defaultdict(set)
+
+    def listen(self, user_id, author_ids):
+        listener = Listener(
+            asyncio.get_running_loop(), user_id, author_ids, self.max_buffer
+        )
+        with self.lock:
+            self.by_user[user_id].add(listener)
+            for author_id in listener.author_ids:
+                self.by_author[author_id].add(listener)
+        return listener
+
+    def forget(self, listener):
+        with self.lock:
+            self.discard(self.by_user, listener.user_id, listener)
+            for author_id in listener.author_ids:
+                self.discard(self.by_author, author_id, listener)
+
+    @staticmethod
+    def discard(index, key, listener):
+        listeners = index.get(key)
+        if listeners is not None:
+            listeners.discard(listener)
+            if not listeners:
+                del index[key]
+
+    def follow(self, user_id, author_id):
+        """
+        Подписка, оформленная при открытом потоке, действует сразу.
+        """
+        with self.lock:
+            for listener in self.by_user.get(user_id, ()):
+                listener.author_ids.add(author_id)
+                self.by_author[author_id].add(listener)
+
+    def unfollow(self, user_id, author_id):
+        with self.lock:
+            for listener in self.by_user.get(user_id, ()):
+                listener.author_ids.discard(author_id)
+                self.discard(self.by_author, author_id, listener)
+
+    def publish(self, recipe):
+        """
+        Отправляет событие о рецепте всем соединениям подписчиков
+        его автора. Событие сериализуется один раз на всех.
+        """
+        with self.lock:
+            listeners = list(self.by_author.get(recipe.author_id, ()))
+        if not listeners:
+            return
+        event = format_event('recipe', {
+            'id': recipe.id,
+            'author': recipe.author_id,
+            'name': recipe.name,
+            'pub_date': recipe.pub_date.isoformat(),
+        })
+        for listener in listeners:
+            try:
+                listener.loop.call_soon_threadsafe(listener.put, event)
+            except RuntimeError:
+                # Цикл соединения уже закрыт, поток сам снимет подписку.
+                pass
+
+
+def format_event(name, data):
+    return (
+        f'event: {name}\n'
+        f'data: {json.dumps(data, ensure_ascii=False)}\n\n'
+    ).encode()
+
+
+recipe_events = RecipeBroadcaster(settings.RECIPE_STREAM_MAX_BUFFER)
@@ -0,0 +1,173 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+Новый рецепт после публикации раскладывается по лентам подписчиков
+автора (TimelineEntry, fan-out on write), и страница ленты читается
+по одному индексу. Автора, у которого подписчиков больше
+FEED_FANOUT_MAX_FOLLOWERS, раскладывать слишком дорого: при следующей
+публикации он помечается fanout_on_read, и дальше его рецепты
+добираются из Recipe при чтении ленты (fan-out on read). Пометка
+не снимается; рецепты, разложенные до нее, при чтении совпадут
+с прочитанными напрямую и склеятся как повторы.
+Раскладка идет в фоновом потоке (FeedPipeline), а не в запросе,
+который опубликовал рецепт: у автора могут быть тысячи подписчиков.
+"""
+from itertools import groupby
+
+from django.conf import settings
+from django.db.models import Count
+
+from users.models import Subscription, User
+
+from .background import BackgroundTask
+from .models import Recipe, TimelineEntry
+
+ORDERING = ('-pub_date', '-id')
+TIMELINE_ORDERING = ('-pub_date', '-recipe_id')
+BATCH_SIZE = 1000
+
+
+def timeline_entries(user_ids, recipes):
+    return (
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in user_ids
+        for recipe_id, author_id, pub_date in recipes
+    )
+
+
+def latest_recipes(author_id):
+    """
+    Последние FEED_BACKFILL_SIZE рецептов автора без пометки
+    fanout_on_read: (id, author_id, pub_date).
+    """
+    return (
+        Recipe.objects
+        .filter(author_id=author_id, author__fanout_on_read=False)
+        .order_by(*ORDERING)
+        .values_list('id', 'author_id', 'pub_date')
+        [:settings.FEED_BACKFILL_SIZE]
+    )
+
+
+def fan_out(recipe_id):
+    """
+    Раскладывает опубликованный рецепт по лентам подписчиков автора.
+    Вызывается после фиксации транзакции, в которой создан рецепт,
+    поэтому подписки, оформленные одновременно с публикацией,
+    либо видны здесь, либо сами добавят рецепт в ленту (см. follow).
+    """
+    recipe = (
+        Recipe.objects.filter(id=recipe_id)
+        .values_list('id', 'author_id', 'pub_date', 'author__fanout_on_read')
+        .first()
+    )
+    if recipe is None or recipe[3]:
+        return
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    user_ids = list(
+        Subscription.objects.filter(
+            author_id=recipe[1], user__isnull=False
+        ).order_by().values_list('user_id', flat=True)[:limit + 1]
+    )
+    if len(user_ids) > limit:
+        User.objects.filter(id=recipe[1]).update(fanout_on_read=True)
+        return
+    TimelineEntry.objects.bulk_create(
+        timeline_entries(user_ids, [recipe[:3]]),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class FeedPipeline(BackgroundTask):
+    """
+    Пул фоновых потоков для fan_out. Ошибки только пишутся в лог:
+    рецепт не попадет в ленты подписчиков до recipes.feed.rebuild().
+    """
+
+    def __init__(self, workers):
+        super().__init__(
+            fan_out, workers, 'recipe-feed',
+            'Не удалось разложить рецепт %s по лентам',
+        )
+
+
+feed_pipeline = FeedPipeline(settings.FEED_FANOUT_WORKERS)
+
+
+def follow(user_id, author_id):
+    """
+    Добавляет в ленту нового подписчика последние рецепты автора.
+    """
+    TimelineEntry.objects.bulk_create(
+        timeline_entries([user_id], latest_recipes(author_id)),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def unfollow(user_id, author_id):
+    """
+    Убирает из ленты бывшего подписчика рецепты автора.
+    """
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+
+
+def sources(user):
+    """
+    Выборки, из которых складывается лента user, с ключами сортировки
+    (см. MergedKeysetPagination): разложенные по ленте рецепты
+    и рецепты авторов с пометкой fanout_on_read.
+    """
+    feed_sources = [
+        (TimelineEntry.objects.filter(user=user), TIMELINE_ORDERING),
+    ]
+    author_ids = list(
+        Subscription.objects.filter(
+            user=user, author__fanout_on_read=True
+        ).values_list('author_id', flat=True)
+    )
+    if author_ids:
+        feed_sources.append(
+            (Recipe.objects.filter(author_id__in=author_ids), ORDERING)
+        )
+    return feed_sources
+
+
+def rebuild(batch_size=5000):
+    """
+    Собирает ленты всех пользователей с нуля. Нужна после массовой
+    загрузки рецептов и подписок через bulk_create, который не шлет
+    сигналы. Авторы, у которых подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS, получают пометку fanout_on_read.
+    """
+    TimelineEntry.objects.all().delete()
+    crowded = (
+        Subscription.objects.order_by()
+        .values('author')
+        .annotate(followers=Count('id'))
+        .filter(followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        .values('author')
+    )
+    User.objects.filter(id__in=crowded).update(fanout_on_read=True)
+    subscriptions = (
+        Subscription.objects
+        .filter(author__fanout_on_read=False, user__isnull=False)
+        .order_by('author_id')
+        .values_list('author_id', 'user_id')
+    )
+    for author_id, rows in groupby(
+        subscriptions.iterator(), key=lambda row: row[0]
+    ):
+        recipes = list(latest_recipes(author_id))
+        if recipes:
+            TimelineEntry.objects.bulk_create(
+                timeline_entries((user_id for _, user_id in rows), recipes),
+                batch_size=batch_size,
+            )
@@ -0,0 +1,168 @@
+"""
+Обработка изображений рецептов.
+Оригинал при сохранении очищается от метаданных (strip_metadata):
+он публично доступен по своему URL и отдается, пока нет вариантов.
+После сохранения рецепта с новым изображением (см. signals.py) задача
+уходит в пул фоновых потоков: изображение поворачивается по EXIF,
+метаданные отбрасываются, варианты фиксированных размеров
+перекодируются в WebP. Pillow отпускает GIL при декодировании,
+масштабировании и кодировании, поэтому потоков достаточно.
+Пока варианты не готовы, сериализаторы отдают оригинал.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import ExifTags, Image, ImageOps
+
+from .background import BackgroundTask
+
+VARIANTS_DIR = 'recipes/variants'
+VARIANT_FORMAT = 'WEBP'
+VARIANT_EXTENSION = 'webp'
+VARIANT_QUALITY = 80
+ORIGINAL_QUALITY = 95
+# Ключи Image.info с метаданными, которые Pillow умеет записать обратно
+# в форматах загрузки (JPEG, PNG, GIF, WebP).
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+# Имя варианта: (максимальный размер, обрезать ли до точного размера).
+VARIANTS = {
+    'large': ((1280, 1280), False),
+    'card': ((640, 480), False),
+    'thumbnail': ((144, 144), True),
+}
+
+
+def variant_name(image_name, variant):
+    """
+    Размер входит в имя: при смене размеров получатся новые файлы,
+    и навсегда закешированные старые URL не устареют.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    (width, height), _ = VARIANTS[variant]
+    return (
+        f'{VARIANTS_DIR}/{stem}_{variant}_{width}x{height}.'
+        f'{VARIANT_EXTENSION}'
+    )
+
+
+def variant_file(recipe, variant):
+    """
+    Файл варианта изображения рецепта или оригинал, если варианты
+    для текущего изображения еще не построены.
+    """
+    image = recipe.image
+    if variant and image and recipe.image_variants == image.name:
+        return image.field.attr_class(
+            recipe, image.field, variant_name(image.name, variant)
+        )
+    return image
+
+
+def has_metadata(image):
+    if any(key in image.info for key in METADATA_KEYS):
+        return True
+    if image.format == 'PNG':
+        # Текстовые чанки и eXIf после IDAT видны только после чтения.
+        image.load()
+        return bool(image.text) or 'exif' in image.info
+    return False
+
+
+def strip_metadata(file):
+    """
+    Возвращает копию изображения без EXIF (в том числе GPS), XMP
+    и комментариев в том же формате. Поворот из EXIF применяется
+    к пикселям; если поворачивать не нужно, JPEG пережимается
+    с исходными таблицами квантования. Файл без метаданных
+    возвращается как есть, без декодирования.
+    """
+    with Image.open(file) as image:
+        if not has_metadata(image):
+            file.seek(0)
+            return file
+        options = {'format': image.format}
+        icc_profile = image.info.get('icc_profile')
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+        if getattr(image, 'is_animated', False):
+            options['save_all'] = True
+            cleaned = image
+        elif orientation != 1:
+            cleaned = ImageOps.exif_transpose(image)
+        else:
+            cleaned = image
+        if image.format == 'JPEG':
+            if cleaned is image:
+                options.update(quality='keep', subsampling='keep')
+            else:
+                options['quality'] = ORIGINAL_QUALITY
+        for key in METADATA_KEYS:
+            cleaned.info.pop(key, None)
+        buffer = io.BytesIO()
+        cleaned.save(buffer, **options)
+    return ContentFile(buffer.getvalue(), name=file.name)
+
+
+def render_variants(file):
+    """
+    Возвращает {имя варианта: байты WebP}.
+    """
+    largest = max(size for size, _ in VARIANTS.values())
+    with Image.open(file) as image:
+        # Для JPEG декодирует сразу в уменьшенном масштабе.
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    result = {}
+    for variant, (size, crop) in VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, VARIANT_FORMAT, quality=VARIANT_QUALITY)
+        result[variant] = buffer.getvalue()
+    return result
+
+
+def build_variants(recipe_id, image_name):
+    """
+    Строит варианты изображения и отмечает их у рецепта, если
+    изображение за это время не поменялось.
+    """
+    from .models import Recipe
+
+    storage = Recipe._meta.get_field('image').storage
+    with storage.open(image_name) as file:
+        variants = render_variants(file)
+    for variant, content in variants.items():
+        storage.save_derived(
+            variant_name(image_name, variant), ContentFile(content)
+        )
+    return Recipe.objects.filter(id=recipe_id, image=image_name).update(
+        image_variants=image_name
+    )
+
+
+class ImagePipeline(BackgroundTask):
+    """
+    Пул фоновых потоков для build_variants. Ошибки только пишутся
+    в лог: рецепт продолжит отдавать оригинал, а построить варианты
+    заново можно командой build_image_variants.
+    """
+
+    def __init__(self, workers):
+        super().__init__(
+            build_variants, workers, 'recipe-images',
+            'Не удалось обработать изображение рецепта %s (%s)',
+        )
+
+
+image_pipeline = ImagePipeline(settings.RECIPE_IMAGE_WORKERS)
@@ -0,0 +1,178 @@
+"""
+Префиксный индекс ингредиентов для автодополнения.
+
+Индекс - отсортированный массив записей в бинарном файле, который
+каждый воркер gunicorn открывает через mmap: страницы файла делятся
+между процессами, поиск идет бинарным поиском без обращений к БД.
+
+Формат файла:
+    MAGIC | count: uint32 | offsets: uint32[count] | записи
+    запись = key \\0 id \\0 name \\0 measurement_unit \\0
+где key - название в casefold, записи отсортированы по key в байтах
+UTF-8 (это совпадает с порядком кодовых точек).
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+MAGIC = b'FGI1'
+HEADER = struct.Struct('<4sI')
+OFFSET = struct.Struct('<I')
+
+
+def normalize(value):
+    return value.strip().casefold()
+
+
+class IngredientIndex:
+    """
+    Открывает файл индекса лениво и переоткрывает его, если файл
+    был заменен (проверка os.stat не чаще раза в check_interval секунд).
+    Сам файл строится командой build_ingredient_index при старте
+    и после изменений ингредиентов, а не в запросе: пока его нет,
+    open() возвращает None.
+    Замененное отображение закрывается не сразу, а при следующей
+    замене: запросы, которые успели его взять, дочитывают его.
+    """
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.mm = None
+        self.retired = None
+        self.stat = None
+        self.checked_at = 0.0
+
+    @property
+    def path(self):
+        return settings.INGREDIENT_INDEX_PATH
+
+    def build(self):
+        """
+        Строит файл индекса из таблицы Ingredient и атомарно
+        подменяет им старый.
+        """
+        from .models import Ingredient
+
+        rows = sorted(
+            (
+                normalize(name).encode(),
+                str(pk).encode(),
+                name.encode(),
+                unit.encode(),
+            )
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        )
+        offsets = []
+        position = 0
+        for row in rows:
+            offsets.append(position)
+            position += sum(map(len, row)) + len(row)
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(rows)))
+            for offset in offsets:
+                file.write(OFFSET.pack(offset))
+            for row in rows:
+                file.write(b'\0'.join(row) + b'\0')
+        os.replace(tmp_path, self.path)
+        self.checked_at = 0.0
+
+    def open(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return self.mm
+        with self.lock:
+            self.checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self.mm
+            if self.stat and (stat.st_ino, stat.st_mtime_ns) == (
+                self.stat.st_ino, self.stat.st_mtime_ns
+            ):
+                return self.mm
+            with open(self.path, 'rb') as file:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, _ = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                mm.close()
+                raise ValueError(f'{self.path} не является индексом.')
+            if self.retired is not None:
+                self.retired.close()
+            self.retired = self.mm
+            self.mm, self.stat = mm, stat
+            return mm
+
+    @staticmethod
+    def record_start(mm, count, index):
+        (offset,) = OFFSET.unpack_from(mm, HEADER.size + OFFSET.size * index)
+        return HEADER.size + OFFSET.size * count + offset
+
+    @staticmethod
+    def read_item(mm, key_end):
+        fields = []
+        end = key_end
+        for _ in range(3):
+            start, end = end + 1, mm.find(b'\0', end + 1)
+            fields.append(mm[start:end])
+        pk, name, unit = fields
+        return {
+            'id': int(pk),
+            'name': name.decode(),
+            'measurement_unit': unit.decode(),
+        }
+
+    def items(self):
+        """
+        Все ингредиенты индекса в порядке ключа.
+        """
+        mm = self.open()
+        if mm is None:
+            return
+        _, count = HEADER.unpack_from(mm, 0)
+        for index in range(count):
+            start = self.record_start(mm, count, index)
+            yield self.read_item(mm, mm.find(b'\0', start))
+
+    def search(self, prefix):
+        """
+        Ингредиенты, название которых начинается с prefix (без учета
+        регистра), в порядке Ingredient.Meta.ordering ('-name').
+        None, если индекс еще не построен.
+        """
+        mm = self.open()
+        if mm is None:
+            return None
+        _, count = HEADER.unpack_from(mm, 0)
+        key = normalize(prefix).encode()
+
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            start = self.record_start(mm, count, middle)
+            if mm[start:mm.find(b'\0', start)] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        result = []
+        for index in range(low, count):
+            start = self.record_start(mm, count, index)
+            end = mm.find(b'\0', start)
+            if not mm[start:end].startswith(key):
+                break
+            result.append(self.read_item(mm, end))
+        result.reverse()
+        return result
+
+
+ingredient_index = IngredientIndex()
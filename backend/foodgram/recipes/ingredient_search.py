@@ -0,0 +1,113 @@
+"""
+Нечеткий поиск ингредиентов с ранжированием: сначала совпадения
+по началу названия, затем по триграммному сходству.
+На PostgreSQL работает через pg_trgm и индексы из миграции
+0021_ingredient_search_indexes, на остальных СУБД - ранжированием
+в Python по префиксному индексу в памяти.
+"""
+import heapq
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, Q, Value, When
+
+from .ingredient_index import ingredient_index, normalize
+from .models import Ingredient
+
+SIMILARITY_THRESHOLD = 0.3
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def trigrams(value):
+    """
+    Множество триграмм строки по правилам pg_trgm: слова в нижнем
+    регистре дополняются двумя пробелами в начале и одним в конце.
+    """
+    result = set()
+    for word in WORD_RE.findall(value.casefold()):
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+def similarity(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class TrigramTable:
+    """
+    Триграммы всех названий, посчитанные один раз для текущей
+    версии файла индекса.
+    """
+
+    def __init__(self):
+        self.stat = None
+        self.rows = []
+
+    def get_rows(self):
+        if ingredient_index.open() is None:
+            # Индекс еще не построен: названия читаются из БД.
+            return [
+                (normalize(item['name']), trigrams(item['name']), item)
+                for item in Ingredient.objects.values(
+                    'id', 'name', 'measurement_unit'
+                )
+            ]
+        if ingredient_index.stat is not self.stat:
+            self.rows = [
+                (normalize(item['name']), trigrams(item['name']), item)
+                for item in ingredient_index.items()
+            ]
+            self.stat = ingredient_index.stat
+        return self.rows
+
+
+trigram_table = TrigramTable()
+
+
+def python_search(query, limit):
+    key = normalize(query)
+    query_trigrams = trigrams(query)
+    candidates = []
+    for name_key, name_trigrams, item in trigram_table.get_rows():
+        is_prefix = name_key.startswith(key)
+        score = similarity(query_trigrams, name_trigrams)
+        if is_prefix or score >= SIMILARITY_THRESHOLD:
+            candidates.append(
+                ((not is_prefix, -score, item['name']), item)
+            )
+    return [
+        item for _, item in heapq.nsmallest(
+            limit, candidates, key=lambda candidate: candidate[0]
+        )
+    ]
+
+
+def postgres_search(query, limit):
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    return list(
+        Ingredient.objects.filter(
+            Q(name__istartswith=query) | Q(name__trigram_similar=query)
+        ).annotate(
+            is_prefix=Case(
+                When(name__istartswith=query, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            similarity=TrigramSimilarity('name', query),
+        ).order_by(
+            '-is_prefix', '-similarity', 'name'
+        ).values('id', 'name', 'measurement_unit')[:limit]
+    )
+
+
+def search(query, limit):
+    """
+    До limit ингредиентов, похожих на query, лучшие первыми.
+    """
+    if connection.vendor == 'postgresql':
+        return postgres_search(query, limit)
+    return python_search(query, limit)
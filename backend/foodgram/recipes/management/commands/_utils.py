@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from django.conf import settings
+
+
+def find_data_file(name):
+    """
+    Ищет файл из каталога data/ репозитория. В docker-образе каталог
+    лежит рядом с manage.py, при локальном запуске - в корне репозитория.
+    """
+    base_dir = Path(settings.BASE_DIR)
+    for data_dir in (base_dir / 'data', base_dir.parent.parent / 'data'):
+        path = data_dir / name
+        if path.exists():
+            return path
+    return base_dir / 'data' / name
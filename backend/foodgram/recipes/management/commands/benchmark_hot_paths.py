@@ -0,0 +1,160 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from api.pagination import KeysetPagination
+from recipes.models import Favorite, IngredientsToRecipe, Recipe, ShoppingCart
+from recipes.shopping_list import export_rows
+from users.models import Subscription
+
+PAGE_SIZE = 10
+KEYSET_ORDERING = KeysetPagination.ordering
+
+
+class Sample:
+    """
+    Значения для запросов: первые по id строки связных таблиц,
+    поэтому прогоны до и после миграции берут одни и те же.
+    """
+
+    def __init__(self):
+        self.favorite = Favorite.objects.order_by('id').first()
+        self.cart_item = ShoppingCart.objects.order_by('id').first()
+        self.subscription = Subscription.objects.order_by('id').first()
+        self.line = IngredientsToRecipe.objects.order_by('id').first()
+        self.recipe = Recipe.objects.order_by('id').first()
+        if not all((self.favorite, self.cart_item, self.subscription,
+                    self.line, self.recipe)):
+            raise CommandError(
+                'Нет данных: заполните базу командой seed_foodgram.'
+            )
+        middle = Recipe.objects.order_by(*KEYSET_ORDERING).values_list(
+            'pub_date', 'id'
+        )[Recipe.objects.count() // 2]
+        self.cursor = KeysetPagination.after(KEYSET_ORDERING, middle)
+        # Владельцы самой маленькой, средней и самой большой корзины:
+        # время выгрузки списка не должно расти вместе с корзиной.
+        carts = list(
+            ShoppingCart.objects.order_by().values_list('user_id')
+            .annotate(size=Count('id')).order_by('size', 'user_id')
+        )
+        picked = {
+            'min': carts[0],
+            'median': carts[len(carts) // 2],
+            'max': carts[-1],
+        }
+        self.cart_users = {
+            label: user_id for label, (user_id, _) in picked.items()
+        }
+        self.cart_sizes = {
+            label: size for label, (_, size) in picked.items()
+        }
+
+
+def exists(queryset):
+    """
+    Запрос в том виде, в каком его выполняет exists(): без сортировки
+    по умолчанию, с LIMIT 1.
+    """
+    return queryset.order_by().values('id')[:1]
+
+
+HOT_PATHS = {
+    'favorite-exists': lambda s: exists(Favorite.objects.filter(
+        user_id=s.favorite.user_id, recipe_id=s.favorite.recipe_id
+    )),
+    'shopping-cart-exists': lambda s: exists(ShoppingCart.objects.filter(
+        user_id=s.cart_item.user_id, recipe_id=s.cart_item.recipe_id
+    )),
+    'subscription-exists': lambda s: exists(Subscription.objects.filter(
+        user_id=s.subscription.user_id, author_id=s.subscription.author_id
+    )),
+    'recipe-ingredient': lambda s: exists(IngredientsToRecipe.objects.filter(
+        recipe_id=s.line.recipe_id, ingredient_id=s.line.ingredient_id
+    )),
+    'shopping-list-download-min': lambda s: export_rows(
+        s.cart_users['min']
+    ),
+    'shopping-list-download-median': lambda s: export_rows(
+        s.cart_users['median']
+    ),
+    'shopping-list-download-max': lambda s: export_rows(
+        s.cart_users['max']
+    ),
+    'recipes-page': lambda s: Recipe.objects.order_by(
+        *KEYSET_ORDERING
+    ).values('id')[:PAGE_SIZE],
+    'recipes-keyset-page': lambda s: Recipe.objects.filter(
+        s.cursor
+    ).order_by(*KEYSET_ORDERING).values('id')[:PAGE_SIZE],
+    'author-recipes-page': lambda s: Recipe.objects.filter(
+        author_id=s.recipe.author_id
+    ).order_by(*KEYSET_ORDERING).values('id')[:PAGE_SIZE],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы и медианное время самых частых выборок '
+        '(проверки избранного, корзины и подписок, выгрузка списка '
+        'покупок, страницы ленты) '
+        'на текущей базе. Для сравнения до и после миграции: '
+        'сохранить результат в --output, применить миграцию '
+        'и запустить с --compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--output',
+            help='Сохранить результаты в JSON-файл.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON-файл с результатами прошлого прогона.'
+        )
+
+    def handle(self, *args, **options):
+        sample = Sample()
+        self.stdout.write('Рецептов в корзинах: ' + ', '.join(
+            f'{label} - {size}' for label, size in sample.cart_sizes.items()
+        ))
+        before = {}
+        if options['compare']:
+            with open(options['compare']) as file:
+                before = json.load(file)
+
+        results = {}
+        for name, build in HOT_PATHS.items():
+            queryset = build(sample)
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                'ms': statistics.median(timings),
+                'plan': queryset.explain(),
+            }
+            self.report(name, results[name], before.get(name), options)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    def report(self, name, result, before, options):
+        if before is None:
+            self.stdout.write(f'{name:<30} {result["ms"]:9.3f} мс')
+            plans = (result['plan'],)
+        else:
+            self.stdout.write(
+                f'{name:<30} {before["ms"]:9.3f} мс -> '
+                f'{result["ms"]:9.3f} мс'
+            )
+            plans = (before['plan'], result['plan'])
+        if options['verbosity'] > 1:
+            for plan in plans:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
@@ -0,0 +1,54 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from recipes.images import ImagePipeline
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные варианты изображений (см. recipes/images.py) '
+        'для рецептов, у которых их еще нет, например после загрузки '
+        'данных или неудачной фоновой обработки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить варианты у всех рецептов.'
+        )
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.exclude(image_variants=F('image'))
+        recipes = recipes.order_by('id').values_list('id', 'image')
+        pipeline = ImagePipeline(options['workers'])
+        done = failed = last_id = 0
+        while True:
+            # Пачки по id, а не iterator(): открытый курсор мешал бы
+            # потокам писать в БД (в SQLite держит блокировку).
+            batch = list(
+                recipes.filter(id__gt=last_id)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            futures = [
+                pipeline.schedule(recipe_id, image_name)
+                for recipe_id, image_name in batch
+            ]
+            wait(futures)
+            for future in futures:
+                if future.result():
+                    done += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, с ошибками: {failed}.'
+        ))
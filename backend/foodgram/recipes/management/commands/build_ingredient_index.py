@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит префиксный индекс ингредиентов для автодополнения '
+        '(см. recipes/ingredient_index.py). Запускается при старте '
+        'контейнера: запросы индекс не строят, а пока его нет, ищут '
+        'в БД.'
+    )
+
+    def handle(self, *args, **options):
+        ingredient_index.build()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиентов в индексе: {Ingredient.objects.count()}.'
+        ))
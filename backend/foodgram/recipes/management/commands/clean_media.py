@@ -0,0 +1,129 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import VARIANTS, VARIANTS_DIR, variant_name
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT изображения рецептов и их варианты, '
+        'на которые больше не ссылается ни один рецепт. Каталоги '
+        'читаются потоково через os.scandir, ссылки из БД - пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, какие файлы будут удалены.'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help=(
+                'Не трогать файлы моложе стольких часов: загрузка могла '
+                'еще не закоммититься, варианты - еще не отметиться.'
+            )
+        )
+        parser.add_argument(
+            '--prefix',
+            action='append',
+            default=[],
+            help=(
+                'Обработать только файлы, имя которых начинается '
+                'с префикса хеша (можно повторять). Позволяет разбить '
+                'большой каталог на несколько запусков, например '
+                '--prefix 0 ... --prefix f.'
+            )
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.prefixes = tuple(options['prefix'])
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        # Ссылки собираются до обхода каталогов: файл, на который
+        # сослались позже, либо новый, либо обновлен хранилищем
+        # (ContentAddressedStorage.save), и его защищает --min-age.
+        referenced = self.referenced_names(options['chunk_size'])
+        deadline = time.time() - options['min_age'] * 3600
+
+        removed = freed = 0
+        for directory in (field.upload_to, VARIANTS_DIR):
+            root = storage.path(directory)
+            for name, entry in self.scan(root, directory.strip('/')):
+                if name in referenced or not self.selected(entry.name):
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime > deadline:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                removed += 1
+                freed += stat.st_size
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {freed / 2 ** 20:.1f} МБ.'
+        ))
+
+    def selected(self, filename):
+        return not self.prefixes or filename.startswith(self.prefixes)
+
+    def referenced_names(self, chunk_size):
+        """
+        Имена файлов, на которые ссылаются рецепты: изображение
+        и варианты как текущего, так и отмеченного изображения.
+        """
+        referenced = set()
+        recipes = Recipe.objects.values_list('image', 'image_variants')
+        for image, image_variants in recipes.iterator(chunk_size):
+            for name in {image, image_variants}:
+                if not name:
+                    continue
+                names = [name] + [
+                    variant_name(name, variant) for variant in VARIANTS
+                ]
+                referenced.update(
+                    file_name for file_name in names
+                    if self.selected(os.path.basename(file_name))
+                )
+        return referenced
+
+    def scan(self, path, name):
+        """
+        Обходит дерево каталога без построения списка файлов,
+        отдает пары (имя в хранилище, DirEntry).
+        """
+        try:
+            entries = os.scandir(path)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                entry_name = f'{name}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    if self.shard_selected(entry.name):
+                        yield from self.scan(entry.path, entry_name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry_name, entry
+
+    def shard_selected(self, dirname):
+        """
+        Каталоги ContentAddressedStorage названы первыми двумя
+        символами хеша: неподходящие под --prefix можно не читать.
+        """
+        if not self.prefixes or len(dirname) != 2:
+            return True
+        return any(
+            dirname.startswith(prefix[:2]) for prefix in self.prefixes
+        )
@@ -0,0 +1,212 @@
+import csv
+import io
+import itertools
+import json
+import re
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes import catalog
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+from ._utils import find_data_file
+
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+CSV_HEADER = ('name', 'measurement_unit')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if tuple(row[:2]) == CSV_HEADER:
+            continue
+        yield row
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """
+    Потоково читает JSON-массив объектов: в памяти держится только
+    текущий кусок файла, а не весь документ.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив объектов.')
+    position = 1
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError('Некорректный или неполный JSON.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if not isinstance(item, dict):
+            raise CommandError('Ожидался JSON-массив объектов.')
+        yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает справочник ингредиентов из CSV (name,measurement_unit) '
+        'или JSON-массива. Файл читается потоково, строки дедуплицируются '
+        'по названию и сохраняются пачками: новые добавляются, у '
+        'существующих обновляются единицы измерения. Повторный запуск '
+        'ничего не меняет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=None,
+            help='Файл с ингредиентами, по умолчанию data/ingredients.csv.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            default=None,
+            help='Формат файла, по умолчанию - по расширению.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загружать через COPY во временную таблицу '
+                 '(только PostgreSQL).'
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'] or find_data_file('ingredients.csv'))
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Не удалось определить формат {path}, укажите --format.'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        self.batch_size = options['batch_size']
+        use_copy = options['copy']
+        if use_copy and connection.vendor != 'postgresql':
+            self.stderr.write('COPY доступен только в PostgreSQL, '
+                              'используется bulk_create.')
+            use_copy = False
+
+        self.inserted = self.updated = self.skipped = 0
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = self.clean_rows(READERS[file_format](file))
+            with transaction.atomic():
+                if use_copy:
+                    self.copy_rows(rows)
+                else:
+                    self.upsert_rows(rows)
+        ingredient_index.build()
+        catalog.bump(Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {self.inserted}, обновлено: {self.updated}, '
+            f'пропущено: {self.skipped}.'
+        ))
+
+    def clean_rows(self, rows):
+        max_length = Ingredient._meta.get_field('name').max_length
+        for row in rows:
+            name, unit = (list(row) + [None, None])[:2]
+            name = (name or '').strip()
+            unit = (unit or '').strip()
+            if not name or not unit or len(name) > max_length:
+                self.skipped += 1
+                continue
+            yield name, unit
+
+    def batches(self, rows):
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def upsert_rows(self, rows):
+        for batch in self.batches(rows):
+            units = dict(batch)
+            self.skipped += len(batch) - len(units)
+            existing = dict(
+                Ingredient.objects.filter(name__in=units).values_list(
+                    'name', 'measurement_unit'
+                )
+            )
+            changed = [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in units.items()
+                if existing.get(name) != unit
+            ]
+            inserted = len(units) - len(existing)
+            self.inserted += inserted
+            self.updated += len(changed) - inserted
+            self.skipped += len(units) - len(changed)
+            if changed:
+                Ingredient.objects.bulk_create(
+                    changed,
+                    update_conflicts=True,
+                    unique_fields=('name',),
+                    update_fields=('measurement_unit',),
+                )
+
+    def copy_rows(self, rows):
+        """
+        Быстрый путь для PostgreSQL: строки уходят через COPY
+        во временную таблицу, затем одним INSERT ... ON CONFLICT
+        переносятся в справочник. При повторе названия побеждает
+        последняя строка файла.
+        """
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_staging ('
+                'seq bigserial, name text, measurement_unit text'
+                ') ON COMMIT DROP'
+            )
+            for batch in self.batches(rows):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_staging (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                total += len(batch)
+            cursor.execute(
+                f'WITH source AS ('
+                f' SELECT DISTINCT ON (name) name, measurement_unit'
+                f' FROM ingredient_staging ORDER BY name, seq DESC'
+                f'), upsert AS ('
+                f' INSERT INTO {table} (name, measurement_unit)'
+                f' SELECT name, measurement_unit FROM source'
+                f' ON CONFLICT (name) DO UPDATE'
+                f' SET measurement_unit = EXCLUDED.measurement_unit'
+                f' WHERE {table}.measurement_unit'
+                f' IS DISTINCT FROM EXCLUDED.measurement_unit'
+                f' RETURNING xmax = 0 AS inserted'
+                f') SELECT count(*) FILTER (WHERE inserted),'
+                f' count(*) FILTER (WHERE NOT inserted) FROM upsert'
+            )
+            inserted, updated = cursor.fetchone()
+        self.inserted += inserted
+        self.updated += updated
+        self.skipped += total - inserted - updated
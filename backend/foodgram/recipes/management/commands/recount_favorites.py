@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает Recipe.favorited_count по таблице избранного. '
+        'Рецепты обновляются пачками по диапазонам id, каждая пачка '
+        'одним UPDATE с подзапросом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        counts = (
+            Favorite.objects.filter(recipe=OuterRef('pk'))
+            .order_by()
+            .values('recipe')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += Recipe.objects.filter(
+                    id__gt=start, id__lte=start + batch_size
+                ).update(favorited_count=Coalesce(Subquery(counts), 0))
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {updated}.'
+        ))
@@ -0,0 +1,352 @@
+import bisect
+import io
+import itertools
+import random
+from array import array
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from PIL import Image
+
+from recipes import catalog, feed, shopping_list
+from recipes.models import (Favorite, Ingredient, IngredientsToRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+from ._utils import find_data_file
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Олег', 'Ольга', 'Петр', 'Софья')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов')
+SEED_IMAGE_NAME = 'seed.png'
+SEED_IMAGE_SIZE = (640, 480)
+SEED_IMAGE_COLOR = (226, 108, 45)
+
+
+class ZipfSampler:
+    """
+    Выбирает индексы 0..size-1 с вероятностью ~ 1 / rank ** exponent:
+    несколько популярных элементов встречаются часто, длинный хвост -
+    редко, как в реальном трафике.
+    """
+
+    def __init__(self, size, exponent, rng):
+        self.rng = rng
+        self.cum_weights = array('d', itertools.accumulate(
+            1 / rank ** exponent for rank in range(1, size + 1)
+        ))
+        self.total = self.cum_weights[-1]
+
+    def __len__(self):
+        return len(self.cum_weights)
+
+    def sample(self):
+        return bisect.bisect(self.cum_weights, self.rng.random() * self.total)
+
+    def sample_distinct(self, count):
+        """
+        До count разных индексов. Для сильно скошенного распределения
+        хвост может не набраться - тогда возвращается сколько вышло.
+        """
+        count = min(count, len(self))
+        result = set()
+        for _ in range(count * 20):
+            if len(result) >= count:
+                break
+            result.add(self.sample())
+        return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Детерминированно генерирует синтетический набор данных '
+        'для нагрузочного тестирования: пользователей, рецепты, '
+        'ингредиенты в рецептах, избранное, списки покупок и подписки. '
+        'Популярность авторов, рецептов и ингредиентов распределена '
+        'по закону Ципфа.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=15)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--ingredients-file',
+            default=None,
+            help='CSV с ингредиентами, по умолчанию data/ingredients.csv.'
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загружать связи через COPY (только PostgreSQL).'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно хотя бы 2 пользователя и 1 рецепт.')
+        if not 0 < options['min_ingredients'] <= options['max_ingredients']:
+            raise CommandError('Проверьте границы числа ингредиентов.')
+
+        self.rng = random.Random(options['seed'])
+        self.zipf = options['zipf']
+        self.batch_size = options['batch_size']
+        self.use_copy = options['copy']
+        if self.use_copy and connection.vendor != 'postgresql':
+            self.stderr.write('COPY доступен только в PostgreSQL, '
+                              'используется bulk_create.')
+            self.use_copy = False
+
+        prefix = f'seed{options["seed"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'выберите другой --seed.'
+            )
+
+        ingredient_ids = self.load_ingredients(
+            options['ingredients_file'] or find_data_file('ingredients.csv')
+        )
+        tag_ids = self.ensure_tags()
+        self.image = self.save_image()
+        user_ids = self.create_users(prefix, options['users'])
+        authors = self.shuffled(user_ids)
+        recipe_ids = self.create_recipes(authors, options['recipes'])
+        recipes = self.shuffled(recipe_ids)
+
+        self.insert_rows(
+            Recipe.tags.through, ('recipe', 'tag'),
+            self.recipe_tags(recipe_ids, tag_ids)
+        )
+        self.insert_rows(
+            IngredientsToRecipe, ('recipe', 'ingredient', 'amount'),
+            self.recipe_ingredients(
+                recipe_ids,
+                self.shuffled(ingredient_ids),
+                options['min_ingredients'],
+                options['max_ingredients'],
+            )
+        )
+        self.insert_rows(
+            Favorite, ('user', 'recipe'),
+            self.user_links(user_ids, recipes, options['favorites'])
+        )
+        call_command(
+            'recount_favorites',
+            batch_size=self.batch_size,
+            stdout=self.stdout
+        )
+        self.insert_rows(
+            ShoppingCart, ('user', 'recipe'),
+            self.user_links(user_ids, recipes, options['carts'])
+        )
+        shopping_list.rebuild(self.batch_size)
+        self.insert_rows(
+            Subscription, ('user', 'author'),
+            self.user_links(
+                user_ids, authors, options['subscriptions'], skip_self=True
+            )
+        )
+        feed.rebuild(self.batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {len(user_ids)} пользователей, '
+            f'{len(recipe_ids)} рецептов.'
+        ))
+
+    def shuffled(self, ids):
+        """
+        Порядок популярности не должен совпадать с порядком id.
+        """
+        ids = array('q', ids)
+        self.rng.shuffle(ids)
+        return ids
+
+    def load_ingredients(self, path):
+        call_command(
+            'load_ingredients',
+            str(path),
+            batch_size=self.batch_size,
+            copy=self.use_copy,
+            stdout=self.stdout,
+        )
+        ids = array('q', Ingredient.objects.order_by('id').values_list(
+            'id', flat=True
+        ))
+        if not ids:
+            raise CommandError(f'В {path} нет ингредиентов.')
+        return ids
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+            catalog.bump(Tag)
+        return array('q', Tag.objects.values_list('id', flat=True))
+
+    def save_image(self):
+        """
+        Рисует одноцветную картинку-заглушку и кладет ее в хранилище
+        изображений рецептов. Хранилище адресует файлы по содержимому,
+        так что при повторных запусках файл остается один.
+        """
+        buffer = io.BytesIO()
+        Image.new('RGB', SEED_IMAGE_SIZE, SEED_IMAGE_COLOR).save(
+            buffer, 'PNG'
+        )
+        field = Recipe._meta.get_field('image')
+        return field.storage.save(
+            field.generate_filename(None, SEED_IMAGE_NAME),
+            ContentFile(buffer.getvalue()),
+            max_length=field.max_length,
+        )
+
+    def create_users(self, prefix, count):
+        password = make_password('password')
+        return self.create_objects(
+            User,
+            (
+                User(
+                    username=f'{prefix}{i}',
+                    email=f'{prefix}{i}@foodgram.local',
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    password=password,
+                )
+                for i in range(count)
+            ),
+        )
+
+    def create_recipes(self, authors, count):
+        sampler = ZipfSampler(len(authors), self.zipf, self.rng)
+        return self.create_objects(
+            Recipe,
+            (
+                Recipe(
+                    name=f'Рецепт {i}',
+                    text=f'Описание рецепта {i}.',
+                    cooking_time=self.rng.randint(5, 180),
+                    image=self.image,
+                    author_id=authors[sampler.sample()],
+                )
+                for i in range(count)
+            ),
+        )
+
+    def create_objects(self, model, objs):
+        """
+        Вставляет объекты пачками и возвращает их id. Id читаются
+        обратно запросом, так что это работает на любой СУБД.
+        """
+        ids = array('q')
+        objs = iter(objs)
+        while True:
+            batch = list(itertools.islice(objs, self.batch_size))
+            if not batch:
+                break
+            last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+            model.objects.bulk_create(batch)
+            ids.extend(
+                model.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)
+            )
+            self.stdout.write(f'{model.__name__}: {len(ids)}')
+        return ids
+
+    def recipe_tags(self, recipe_ids, tag_ids):
+        tag_ids = list(tag_ids)
+        for recipe_id in recipe_ids:
+            count = self.rng.randint(1, len(tag_ids))
+            for tag_id in self.rng.sample(tag_ids, count):
+                yield recipe_id, tag_id
+
+    def recipe_ingredients(self, recipe_ids, ingredient_ids, low, high):
+        sampler = ZipfSampler(len(ingredient_ids), self.zipf, self.rng)
+        for recipe_id in recipe_ids:
+            count = self.rng.randint(low, high)
+            for index in sampler.sample_distinct(count):
+                yield recipe_id, ingredient_ids[index], self.rng.randint(
+                    1, 500
+                )
+
+    def user_links(self, user_ids, targets, average, skip_self=False):
+        """
+        Связи пользователь -> рецепт или автор. Сколько связей у
+        пользователя - равномерно от 0 до 2 * average, к чему именно -
+        по Ципфу, так что у популярных рецептов и авторов плотные графы.
+        """
+        if not average:
+            return
+        sampler = ZipfSampler(len(targets), self.zipf, self.rng)
+        for user_id in user_ids:
+            count = self.rng.randint(0, 2 * average)
+            for index in sampler.sample_distinct(count):
+                if skip_self and targets[index] == user_id:
+                    continue
+                yield user_id, targets[index]
+
+    def insert_rows(self, model, fields, rows):
+        fields = [model._meta.get_field(name) for name in fields]
+        rows = iter(rows)
+        total = 0
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            if self.use_copy:
+                self.copy_rows(model, fields, batch)
+            else:
+                model.objects.bulk_create(
+                    model(**{
+                        field.attname: value
+                        for field, value in zip(fields, row)
+                    })
+                    for row in batch
+                )
+            total += len(batch)
+        self.stdout.write(f'{model._meta.object_name}: {total}')
+
+    def copy_rows(self, model, fields, rows):
+        """
+        Быстрый путь для PostgreSQL: все значения в связях - целые числа,
+        поэтому их можно отдать в COPY без экранирования.
+        """
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(map(str, row)) + '\n')
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN',
+                buffer
+            )
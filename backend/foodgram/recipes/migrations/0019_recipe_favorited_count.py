@@ -0,0 +1,36 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_favorited_count(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    counts = (
+        Favorite.objects.filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Recipe.objects.update(favorited_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_alter_recipe_options_recipe_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorited_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.RunPython(
+            fill_favorited_count, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+INDEXES = (
+    (
+        'recipes_ingredient_name_trgm',
+        'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+        'ON recipes_ingredient USING gin (name gin_trgm_ops)',
+    ),
+    (
+        'recipes_ingredient_name_upper_like',
+        'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_like '
+        'ON recipes_ingredient (UPPER(name) text_pattern_ops)',
+    ),
+)
+
+
+def create_indexes(apps, schema_editor):
+    """
+    Индексы для нечеткого поиска ингредиентов: GIN по триграммам
+    для name % query и индекс по UPPER(name) для istartswith.
+    Нужны только на PostgreSQL. Расширение pg_trgm при откате
+    не удаляется: им могут пользоваться и другие объекты базы.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for _, sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_shoppinglistitem_shoppinglistversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
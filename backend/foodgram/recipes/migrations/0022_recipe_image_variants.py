@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_ingredient_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100, verbose_name='Изображение, для которого построены варианты'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:36
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.recipe_image_storage, upload_to='recipes/media/', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,151 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+from recipes.operations import (AddIndexConcurrently,
+                                AddUniqueConstraintConcurrently)
+
+MAX_AMOUNT = 32767
+
+
+def duplicate_groups(model, fields):
+    """
+    Группы строк с одинаковыми значениями fields: значения полей,
+    id оставляемой (самой ранней) строки и число строк.
+    """
+    return (
+        model.objects.order_by()
+        .values(*fields)
+        .annotate(keep=Min('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+    )
+
+
+def remove_duplicates(model, fields):
+    """
+    Удаляет дубли, оставляя самую раннюю строку группы.
+    Возвращает сами группы.
+    """
+    groups = list(duplicate_groups(model, fields))
+    for group in groups:
+        model.objects.filter(
+            **{field: group[field] for field in fields}
+        ).exclude(id=group['keep']).delete()
+    return groups
+
+
+def rebuild_shopping_lists(apps, user_ids):
+    """
+    Итоги списков покупок учитывали каждую строку корзины,
+    поэтому после удаления дублей пересчитываются заново.
+    """
+    IngredientsToRecipe = apps.get_model('recipes', 'IngredientsToRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    ShoppingListVersion = apps.get_model('recipes', 'ShoppingListVersion')
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    totals = (
+        IngredientsToRecipe.objects
+        .filter(recipe__shopping_cart__user__in=user_ids)
+        .order_by()
+        .values_list('recipe__shopping_cart__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+    )
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=total)
+        for user_id, ingredient_id, total in totals
+    )
+    for user_id in user_ids:
+        version, _ = ShoppingListVersion.objects.get_or_create(
+            user_id=user_id
+        )
+        version.version += 1
+        version.save(update_fields=('version',))
+
+
+def deduplicate(apps, schema_editor):
+    """
+    Перед уникальными ограничениями убираем накопившиеся дубли,
+    сохраняя производные данные: количества повторенного
+    в рецепте ингредиента складываются, счетчики избранного
+    и списки покупок пересчитываются.
+    """
+    Favorite = apps.get_model('recipes', 'Favorite')
+    IngredientsToRecipe = apps.get_model('recipes', 'IngredientsToRecipe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+
+    fields = ('recipe', 'ingredient')
+    for group in duplicate_groups(IngredientsToRecipe, fields):
+        rows = IngredientsToRecipe.objects.filter(
+            **{field: group[field] for field in fields}
+        )
+        total = rows.aggregate(total=Sum('amount'))['total']
+        rows.filter(id=group['keep']).update(
+            amount=min(total, MAX_AMOUNT)
+        )
+        rows.exclude(id=group['keep']).delete()
+
+    groups = remove_duplicates(Favorite, ('user', 'recipe'))
+    for recipe_id in {group['recipe'] for group in groups}:
+        Recipe.objects.filter(id=recipe_id).update(
+            favorited_count=Favorite.objects.filter(
+                recipe_id=recipe_id
+            ).count()
+        )
+
+    groups = remove_duplicates(ShoppingCart, ('user', 'recipe'))
+    if groups:
+        rebuild_shopping_lists(apps, {group['user'] for group in groups})
+
+
+class Migration(migrations.Migration):
+    """
+    Индексы и уникальные ограничения для самых частых выборок.
+    На PostgreSQL строятся CONCURRENTLY (см. recipes/operations.py),
+    поэтому миграция не атомарна. Если между удалением дублей
+    и построением индекса успеет появиться новый дубль, построение
+    упадет - миграцию достаточно запустить повторно.
+    """
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0023_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            deduplicate, migrations.RunPython.noop, atomic=True
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_idx'
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_favorite'
+            ),
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name='ingredientstorecipe',
+            constraint=models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            ),
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_shopping_cart'
+            ),
+        ),
+    ]
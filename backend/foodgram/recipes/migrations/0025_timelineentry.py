@@ -0,0 +1,90 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from itertools import groupby
+
+
+def fill_timelines(apps, schema_editor):
+    """
+    Ленты существующих подписок: последние FEED_BACKFILL_SIZE
+    рецептов каждого автора у каждого его подписчика. Авторы,
+    у которых подписчиков больше FEED_FANOUT_MAX_FOLLOWERS,
+    помечаются fanout_on_read и читаются напрямую.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('users', 'Subscription')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    User = apps.get_model('users', 'User')
+    crowded = (
+        Subscription.objects.order_by()
+        .values('author')
+        .annotate(followers=models.Count('id'))
+        .filter(followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        .values('author')
+    )
+    User.objects.filter(id__in=crowded).update(fanout_on_read=True)
+    subscriptions = (
+        Subscription.objects
+        .filter(author__fanout_on_read=False, user__isnull=False)
+        .order_by('author_id')
+        .values_list('author_id', 'user_id')
+    )
+    for author_id, rows in groupby(
+        subscriptions.iterator(), key=lambda row: row[0]
+    ):
+        recipes = list(
+            Recipe.objects.filter(author_id=author_id)
+            .order_by('-pub_date', '-id')
+            .values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        )
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for _, user_id in rows
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0024_hot_path_indexes'),
+        ('users', '0008_user_fanout_on_read'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата создания рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Записи лент подписок',
+                'ordering': ('-pub_date', '-recipe'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,8 @@ from django.utils.text import slugify
 
 from users.models import User
 
+from .storage import recipe_image_storage
+
 
 class Tag(models.Model):
     """
@@ -72,8 +74,12 @@ class Ingredient(models.Model):
 
 class Recipe(models.Model):
     """
-    Модель рецептов. Property favorited_count показывает
-    общее количество раз, когда рецепт добавили в избранное.
+    Модель рецептов. Поле favorited_count хранит общее количество раз,
+    когда рецепт добавили в избранное. Счетчик обновляется сигналами
+    Favorite (см. recipes/signals.py), пересчитать его целиком можно
+    командой recount_favorites. Поле image_variants хранит имя
+    изображения, для которого уже построены уменьшенные варианты
+    (см. recipes/images.py).
     """
     name = models.CharField(
         max_length=256,
@@ -92,9 +98,17 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение',
         upload_to='recipes/media/',
+        storage=recipe_image_storage,
         null=False,
         blank=False
     )
+    image_variants = models.CharField(
+        'Изображение, для которого построены варианты',
+        max_length=100,
+        blank=True,
+        default='',
+        editable=False,
+    )
     cooking_time = models.PositiveSmallIntegerField(
         null=False,
         blank=False,
@@ -115,6 +129,11 @@ class Recipe(models.Model):
         'Дата создания',
         auto_now_add=True
     )
+    favorited_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        db_index=True
+    )
 
     filter_horizontal = ('tags')
 
@@ -122,14 +141,22 @@ class Recipe(models.Model):
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        # Под сортировку ленты и курсорную пагинацию (-pub_date, -id),
+        # в том числе рецептов одного автора.
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
-    @property
-    def favorited_count(self):
-        return Favorite.objects.filter(recipe=self).count()
-
 
 class IngredientsToRecipe(models.Model):
     """
@@ -157,6 +184,12 @@ class IngredientsToRecipe(models.Model):
         ordering = ('-recipe',)
         verbose_name = 'Ингредиенты к рецептам'
         verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe} <- {self.ingredient.name}'
@@ -187,6 +220,12 @@ class Favorite(models.Model):
         ordering = ('-user',)
         verbose_name = 'Добавление в избранное'
         verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} likes {self.recipe}'
@@ -217,6 +256,141 @@ class ShoppingCart(models.Model):
         ordering = ('-user',)
         verbose_name = 'Добавление рецептов в список покупок'
         verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} buys {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Итоговое количество ингредиента в списке покупок пользователя.
+    Поддерживается инкрементально при изменении корзины и состава
+    рецептов в ней (см. recipes/shopping_list.py).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        ordering = ('user', 'ingredient__name')
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} x {self.amount}'
+
+
+class ShoppingListVersion(models.Model):
+    """
+    Версия списка покупок пользователя. Увеличивается при каждом
+    изменении итогов и используется как ETag при скачивании.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='shopping_list_version',
+        verbose_name='Пользователь'
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+
+    class Meta:
+        verbose_name = 'Версия списка покупок'
+        verbose_name_plural = 'Версии списков покупок'
+
+    def __str__(self):
+        return f'{self.user}: v{self.version}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Строки раскладываются
+    при публикации рецепта и при подписке (см. recipes/feed.py).
+    Автор и дата публикации скопированы из рецепта, чтобы страница
+    ленты выбиралась по одному индексу, без соединения с рецептами.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Читатель'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата создания рецепта')
+
+    class Meta:
+        ordering = ('-pub_date', '-recipe')
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи лент подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class CatalogVersion(models.Model):
+    """
+    Текущая версия справочника (см. recipes/catalog.py).
+    """
+    label = models.CharField(
+        'Модель справочника',
+        max_length=100,
+        primary_key=True
+    )
+    token = models.CharField('Версия', max_length=32)
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.label}: {self.token}'
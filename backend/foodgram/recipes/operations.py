@@ -0,0 +1,82 @@
+"""
+Операции миграций для индексов на живых таблицах.
+На PostgreSQL индексы строятся CONCURRENTLY, не блокируя запись
+в таблицу, на остальных базах - как обычные AddIndex/AddConstraint.
+Миграция с такими операциями должна быть atomic = False.
+"""
+from django.db import migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    Индекс, оставшийся невалидным после неудачного прогона,
+    пересоздается при повторном.
+    """
+
+    def describe(self):
+        return 'Concurrently ' + super().describe()
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS '
+                + schema_editor.quote_name(self.index.name)
+            )
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class AddUniqueConstraintConcurrently(migrations.AddConstraint):
+    """
+    UniqueConstraint по полям. На PostgreSQL сначала строится
+    уникальный индекс CONCURRENTLY, затем ограничение подключается
+    к готовому индексу (ADD CONSTRAINT ... USING INDEX) под короткой
+    блокировкой. Индекс, оставшийся невалидным после неудачного
+    прогона, пересоздается при повторном.
+    """
+
+    def describe(self):
+        return 'Concurrently ' + super().describe()
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(
+            schema_editor.connection.alias, model
+        ):
+            return
+        quote = schema_editor.quote_name
+        name = quote(self.constraint.name)
+        table = quote(model._meta.db_table)
+        columns = ', '.join(
+            quote(model._meta.get_field(field).column)
+            for field in self.constraint.fields
+        )
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY {name} '
+            f'ON {table} ({columns})'
+        )
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} '
+            f'UNIQUE USING INDEX {name}'
+        )
@@ -0,0 +1,221 @@
+"""
+Инкрементальное обновление итогов списка покупок.
+Все функции рассчитаны на вызов внутри транзакции,
+в которой меняется корзина или состав рецепта.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import (IngredientsToRecipe, ShoppingCart, ShoppingListItem,
+                     ShoppingListVersion)
+
+
+def recipe_lines(recipe_id):
+    """
+    Состав рецепта: {ingredient_id: amount}.
+    """
+    return dict(
+        IngredientsToRecipe.objects.filter(recipe_id=recipe_id)
+        .order_by()
+        .values_list('ingredient_id')
+        .annotate(total=Sum('amount'))
+    )
+
+
+def get_version(user):
+    return (
+        ShoppingListVersion.objects.filter(user=user)
+        .values_list('version', flat=True)
+        .first()
+    ) or 0
+
+
+def bump_versions(user_ids):
+    """
+    Строки версий создаются с игнорированием конфликтов, чтобы
+    одновременное первое изменение списка в двух транзакциях
+    не падало на уникальности, а увеличение идет уже под блокировкой.
+    """
+    ShoppingListVersion.objects.bulk_create(
+        (
+            ShoppingListVersion(user_id=user_id, version=0)
+            for user_id in user_ids
+        ),
+        ignore_conflicts=True,
+    )
+    ShoppingListVersion.objects.filter(user_id__in=user_ids).update(
+        version=F('version') + 1
+    )
+
+
+def update_existing(deltas):
+    """
+    Переносит изменения в существующие позиции (под блокировкой строк).
+    Возвращает изменения для позиций, которых еще нет.
+    """
+    user_ids = {user_id for user_id, _ in deltas}
+    ingredient_ids = {ingredient_id for _, ingredient_id in deltas}
+    items = ShoppingListItem.objects.select_for_update().filter(
+        user_id__in=user_ids, ingredient_id__in=ingredient_ids
+    )
+    to_update, to_delete, seen = [], [], set()
+    for item in items:
+        key = (item.user_id, item.ingredient_id)
+        if key not in deltas:
+            continue
+        seen.add(key)
+        item.amount += deltas[key]
+        if item.amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.id)
+    ShoppingListItem.objects.bulk_update(to_update, ['amount'])
+    if to_delete:
+        ShoppingListItem.objects.filter(id__in=to_delete).delete()
+    return {
+        key: delta for key, delta in deltas.items()
+        if key not in seen and delta > 0
+    }
+
+
+def create_items(deltas):
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=delta
+        )
+        for (user_id, ingredient_id), delta in deltas.items()
+    )
+
+
+@transaction.atomic(savepoint=False)
+def apply_deltas(deltas):
+    """
+    Применяет изменения {(user_id, ingredient_id): delta} к итогам
+    пачкой запросов: позиции, дошедшие до нуля, удаляются.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    missing = update_existing(deltas)
+    if missing:
+        try:
+            with transaction.atomic():
+                create_items(missing)
+        except IntegrityError:
+            # Те же позиции одновременно создала другая транзакция.
+            # После ее фиксации они видны и обновляются как существующие.
+            create_items(update_existing(missing))
+    bump_versions({user_id for user_id, _ in deltas})
+
+
+def cart_changed(user_id, recipe_id, sign):
+    """
+    Рецепт добавлен в корзину (sign=1) или удален из нее (sign=-1).
+    """
+    apply_deltas({
+        (user_id, ingredient_id): sign * amount
+        for ingredient_id, amount in recipe_lines(recipe_id).items()
+    })
+
+
+def recipe_changed(recipe_id, old_lines, new_lines):
+    """
+    Состав рецепта изменился: разница переносится в итоги
+    всех пользователей, у которых рецепт лежит в корзине.
+    """
+    difference = Counter(new_lines)
+    difference.subtract(old_lines)
+    difference = {key: value for key, value in difference.items() if value}
+    if not difference:
+        return
+    carts = (
+        ShoppingCart.objects.filter(recipe_id=recipe_id)
+        .order_by()
+        .values_list('user_id')
+        .annotate(times=Count('id'))
+    )
+    apply_deltas({
+        (user_id, ingredient_id): delta * times
+        for user_id, times in carts
+        for ingredient_id, delta in difference.items()
+    })
+
+
+def recipe_deleted(recipe_id):
+    """
+    Рецепт удаляется: его состав вычитается из итогов всех корзин
+    с ним одним пересчетом, а не по корзине за раз.
+    """
+    recipe_changed(recipe_id, recipe_lines(recipe_id), {})
+
+
+def export_rows(user_id):
+    """
+    Строки выгрузки списка покупок: название, единица измерения
+    и итог по каждому ингредиенту. Их число не зависит от того,
+    сколько рецептов в корзине.
+    """
+    return (
+        ShoppingListItem.objects.filter(user_id=user_id)
+        .values_list(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount'
+        )
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+    )
+
+
+def ingredient_changed(ingredient_id):
+    """
+    Название и единицы ингредиента попадают в выгрузку списка, поэтому
+    при их изменении и при удалении ингредиента меняется версия
+    списков, где он есть. При удалении вызывается до каскадного
+    удаления позиций.
+    """
+    user_ids = set(
+        ShoppingListItem.objects.filter(ingredient_id=ingredient_id)
+        .values_list('user_id', flat=True)
+    )
+    if user_ids:
+        bump_versions(user_ids)
+
+
+@transaction.atomic
+def rebuild(batch_size=5000):
+    """
+    Пересчитывает итоги всех списков покупок с нуля. Нужна после
+    массовой загрузки корзин через bulk_create, который не шлет сигналы.
+    """
+    ShoppingListItem.objects.all().delete()
+    totals = (
+        IngredientsToRecipe.objects
+        .filter(recipe__shopping_cart__user__isnull=False)
+        .order_by()
+        .values_list('recipe__shopping_cart__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+    )
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for user_id, ingredient_id, total in totals.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    ShoppingListVersion.objects.update(version=F('version') + 1)
+    ShoppingListVersion.objects.bulk_create(
+        (
+            ShoppingListVersion(user_id=user_id, version=1)
+            for user_id in ShoppingCart.objects
+            .exclude(user__shopping_list_version__isnull=False)
+            .order_by()
+            .values_list('user_id', flat=True)
+            .distinct()
+            .iterator()
+        ),
+        batch_size=batch_size,
+    )
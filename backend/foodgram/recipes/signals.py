@@ -0,0 +1,183 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import Subscription
+
+from . import catalog, feed, shopping_list
+from .events import recipe_events
+from .images import image_pipeline
+from .ingredient_index import ingredient_index
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+
+
+def deleted_with_recipe(instance, origin):
+    """
+    Строка удаляется каскадом из recipe.delete() вместе со своим
+    рецептом: ее учитывают обработчики удаления самого рецепта.
+    """
+    return isinstance(origin, Recipe) and origin.pk == instance.recipe_id
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorited_count(sender, instance, created, **kwargs):
+    """
+    Атомарно увеличивает счетчик избранного у рецепта.
+    """
+    if created and instance.recipe_id:
+        Recipe.objects.filter(id=instance.recipe_id).update(
+            favorited_count=F('favorited_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorited_count(sender, instance, origin=None, **kwargs):
+    """
+    Атомарно уменьшает счетчик избранного у рецепта.
+    Срабатывает и при каскадном удалении (например, пользователя),
+    кроме удаления самого рецепта: его счетчик уже не нужен.
+    """
+    if deleted_with_recipe(instance, origin):
+        return
+    if instance.recipe_id:
+        Recipe.objects.filter(
+            id=instance.recipe_id,
+            favorited_count__gt=0
+        ).update(favorited_count=F('favorited_count') - 1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    """
+    Добавляет ингредиенты рецепта в итоги списка покупок.
+    """
+    if created and instance.user_id and instance.recipe_id:
+        shopping_list.cart_changed(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, origin=None, **kwargs):
+    """
+    Вычитает ингредиенты рецепта из итогов списка покупок.
+    pre_delete, а не post_delete: при каскадном удалении рецепта
+    его ингредиенты к этому моменту еще не удалены.
+    """
+    if deleted_with_recipe(instance, origin):
+        return
+    if instance.user_id and instance.recipe_id:
+        shopping_list.cart_changed(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, origin=None,
+                                      **kwargs):
+    """
+    recipe.delete() вычитает рецепт из всех корзин сразу. При удалении
+    через queryset или каскадом от автора итоги по-прежнему
+    пересчитываются по каждой корзине.
+    """
+    if isinstance(origin, Recipe) and origin.pk == instance.pk:
+        shopping_list.recipe_deleted(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_shopping_lists(sender, instance, created, **kwargs):
+    """
+    Меняет версию списков покупок с измененным ингредиентом.
+    """
+    if not created:
+        shopping_list.ingredient_changed(instance.id)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def drop_from_shopping_lists(sender, instance, **kwargs):
+    """
+    Меняет версию списков покупок, из которых каскадно
+    удалится ингредиент.
+    """
+    shopping_list.ingredient_changed(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def rebuild_ingredient_index(sender, **kwargs):
+    """
+    Пересобирает префиксный индекс после фиксации транзакции.
+    Остальные воркеры увидят новый файл при следующей проверке.
+    """
+    transaction.on_commit(ingredient_index.build)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_catalog_version(sender, **kwargs):
+    """
+    Меняет версию справочника, по которой строятся ETag.
+    """
+    catalog.bump(sender)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(sender, instance, **kwargs):
+    """
+    После фиксации транзакции отправляет новое изображение рецепта
+    на построение вариантов.
+    """
+    if instance.image and instance.image.name != instance.image_variants:
+        recipe_id, image_name = instance.id, instance.image.name
+        transaction.on_commit(
+            lambda: image_pipeline.schedule(recipe_id, image_name)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    """
+    После фиксации транзакции отправляет новый рецепт на раскладку
+    по лентам подписчиков автора.
+    """
+    if created:
+        recipe_id = instance.id
+        transaction.on_commit(
+            lambda: feed.feed_pipeline.schedule(recipe_id)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def announce_recipe(sender, instance, created, **kwargs):
+    """
+    После фиксации транзакции сообщает о новом рецепте открытым
+    потокам подписчиков автора.
+    """
+    if created:
+        transaction.on_commit(lambda: recipe_events.publish(instance))
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """
+    Добавляет в ленту нового подписчика последние рецепты автора,
+    открытые потоки подписчика начинают получать события о них.
+    """
+    if created and instance.user_id and instance.author_id:
+        user_id, author_id = instance.user_id, instance.author_id
+        transaction.on_commit(lambda: feed.follow(user_id, author_id))
+        transaction.on_commit(
+            lambda: recipe_events.follow(user_id, author_id)
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def trim_timeline(sender, instance, **kwargs):
+    """
+    Убирает рецепты автора из ленты и потоков бывшего подписчика.
+    """
+    if instance.user_id and instance.author_id:
+        user_id, author_id = instance.user_id, instance.author_id
+        transaction.on_commit(lambda: feed.unfollow(user_id, author_id))
+        transaction.on_commit(
+            lambda: recipe_events.unfollow(user_id, author_id)
+        )
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранит файл под именем из SHA-256 его содержимого:
+    <каталог upload_to>/<2 символа хеша>/<хеш>.<расширение>.
+    Одинаковые файлы (например, то же фото при редактировании рецепта)
+    записываются один раз, повторное сохранение возвращает имя уже
+    существующего файла. Файл по такому имени никогда не меняется,
+    поэтому его URL можно кешировать навсегда (см. infra/nginx.conf).
+    На один файл могут ссылаться несколько рецептов, поэтому при смене
+    изображения старый файл не удаляется: неиспользуемые файлы убирает
+    команда clean_media.
+    """
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Свежее время изменения не даст clean_media удалить файл,
+            # который считался неиспользуемым до этого сохранения.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_derived(self, name, content):
+        """
+        Сохраняет производный файл (вариант изображения) под заданным
+        именем, заменяя прежний: имя уже выведено из хеша оригинала.
+        Новый файл пишется под временным именем и атомарно подменяет
+        прежний, поэтому по этому URL файл отдается и во время записи.
+        """
+        temporary = super().save(f'{name}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def recipe_image_storage():
+    return content_addressed_storage
@@ -0,0 +1,76 @@
+"""
+Пакетная загрузка флага is_subscribed для ответа API.
+Загрузчик живет на объекте запроса. Списки пользователей заранее
+регистрируют в нем id всех авторов (см. SubscribedListSerializer),
+и первый же вопрос о любом из них решается одним запросом
+к Subscription на всех. Ответы запоминаются до конца запроса.
+"""
+from rest_framework import serializers
+
+from .models import Subscription
+
+
+class SubscriptionLoader:
+    def __init__(self, user):
+        self.user = user
+        self.pending = set()
+        self.resolved = {}
+
+    def prime(self, author_ids):
+        """
+        Регистрирует авторов, о которых скоро спросят.
+        """
+        self.pending.update(
+            author_id for author_id in author_ids
+            if author_id not in self.resolved
+        )
+
+    def is_subscribed(self, author_id):
+        if author_id not in self.resolved:
+            self.pending.add(author_id)
+            self.resolve()
+        return self.resolved[author_id]
+
+    def resolve(self):
+        author_ids, self.pending = self.pending, set()
+        subscribed = set(
+            Subscription.objects.filter(
+                user=self.user, author_id__in=author_ids
+            ).values_list('author_id', flat=True)
+        )
+        for author_id in author_ids:
+            self.resolved[author_id] = author_id in subscribed
+
+
+def get_subscription_loader(request):
+    """
+    Загрузчик текущего запроса или None для анонимного пользователя.
+    """
+    if request is None or request.user.is_anonymous:
+        return None
+    loader = getattr(request, '_subscription_loader', None)
+    if loader is None or loader.user != request.user:
+        loader = SubscriptionLoader(request.user)
+        request._subscription_loader = loader
+    return loader
+
+
+class SubscribedListSerializer(serializers.ListSerializer):
+    """
+    Перед выводом списка регистрирует в загрузчике всех его авторов.
+    Атрибут с id автора у элемента списка задается в Meta дочернего
+    сериализатора как subscription_author_field (по умолчанию id:
+    элементы - сами пользователи).
+    """
+
+    def to_representation(self, data):
+        if hasattr(data, 'all'):
+            data = data.all()
+        items = list(data)
+        loader = get_subscription_loader(self.context.get('request'))
+        if loader is not None:
+            field = getattr(
+                self.child.Meta, 'subscription_author_field', 'id'
+            )
+            loader.prime(getattr(item, field) for item in items)
+        return super().to_representation(items)
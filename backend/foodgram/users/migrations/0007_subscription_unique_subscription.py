@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from recipes.operations import AddUniqueConstraintConcurrently
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Перед уникальным ограничением оставляем самую раннюю
+    из повторяющихся подписок.
+    """
+    Subscription = apps.get_model('users', 'Subscription')
+    groups = (
+        Subscription.objects.order_by()
+        .values('user', 'author')
+        .annotate(keep=Min('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+    )
+    for group in list(groups):
+        Subscription.objects.filter(
+            user=group['user'], author=group['author']
+        ).exclude(id=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+    """
+    Ограничение строится CONCURRENTLY на PostgreSQL
+    (см. recipes/operations.py), поэтому миграция не атомарна.
+    """
+    atomic = False
+
+    dependencies = [
+        ('users', '0006_alter_subscription_options_alter_user_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicates, migrations.RunPython.noop, atomic=True
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_subscription'
+            ),
+        ),
+    ]
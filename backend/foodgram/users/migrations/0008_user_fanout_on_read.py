@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_subscription_unique_subscription'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='fanout_on_read',
+            field=models.BooleanField(default=False, help_text='Ставится автоматически, когда подписчиков слишком много, чтобы раскладывать рецепты по их лентам.', verbose_name='Рецепты в ленты подписчиков добавляются при чтении'),
+        ),
+    ]
@@ -42,6 +42,14 @@ class User(AbstractUser):
         related_name='followers',
         verbose_name='following',
         symmetrical=False)
+    fanout_on_read = models.BooleanField(
+        verbose_name='Рецепты в ленты подписчиков добавляются при чтении',
+        default=False,
+        help_text=(
+            'Ставится автоматически, когда подписчиков слишком много, '
+            'чтобы раскладывать рецепты по их лентам.'
+        ),
+    )
 
     class Meta:
         ordering = ('-username',)
@@ -82,6 +90,12 @@ class Subscription(models.Model):
         ordering = ('-user',)
         verbose_name = 'Подписки'
         verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_subscription'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} follows {self.author}'
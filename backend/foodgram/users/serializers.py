@@ -1,14 +1,27 @@
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from recipes.images import variant_file
 from recipes.models import Favorite, Recipe, ShoppingCart
 
+from .loaders import SubscribedListSerializer, get_subscription_loader
 from .models import Subscription, User
 
 
+def get_recipes_limit(request):
+    """
+    Число рецептов автора в ответе из параметра recipes_limit,
+    None - без ограничения.
+    """
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return recipes_limit if recipes_limit > 0 else None
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Базовый сериализатор для работы с пользователями.
@@ -43,6 +56,7 @@ class UserSerializer(serializers.ModelSerializer):
             'is_subscribed'
         )
         model = User
+        list_serializer_class = SubscribedListSerializer
 
     @transaction.atomic
     def create(self, validated_data):
@@ -53,14 +67,16 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
     def get_is_subscribed(self, instance):
-        if not self.context:
-            return False
-        user = self.context['request'].user
-        if user.is_anonymous:
+        """
+        Флаг из аннотации queryset-а, если она есть, иначе
+        из пакетного загрузчика запроса (см. users/loaders.py).
+        """
+        loader = get_subscription_loader(self.context.get('request'))
+        if loader is None:
             return False
-        return Subscription.objects.filter(
-            user=user, author=instance
-        ).exists()
+        if hasattr(instance, 'is_subscribed'):
+            return instance.is_subscribed
+        return loader.is_subscribed(instance.id)
 
 
 class GetTokenSerializer(serializers.ModelSerializer):
@@ -107,13 +123,31 @@ class UpdatePasswordSerializer(serializers.ModelSerializer):
         return data
 
 
+class RecipeImageField(serializers.ImageField):
+    """
+    Ссылка на вариант изображения рецепта: заданный в variant
+    или, если он не задан, переданный в контексте как image_variant.
+    Пока варианты не построены, отдается оригинал.
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return variant_file(
+            instance, self.variant or self.context.get('image_variant')
+        )
+
+
 class RecipeReadMinimalSerializer(serializers.ModelSerializer):
     """
     Сериализатор для краткой информации о рецепте.
     Используется во вложенных рецептах (например, в users/subscriptions),
     а также при добавлении в избранное или список покупок.
     """
-    image = Base64ImageField(max_length=None, use_url=True, read_only=True)
+    image = RecipeImageField('thumbnail')
     name = serializers.CharField(read_only=True)
     cooking_time = serializers.CharField(read_only=True)
     id = serializers.IntegerField(read_only=True)
@@ -129,12 +163,12 @@ class RecipeReadMinimalSerializer(serializers.ModelSerializer):
             id=self.context['kwargs'].get('pk')
         )
         if self.context['action'] == 'shopping_cart':
-            if ShoppingCart.objects.filter(user=user, recipe=recipe):
+            if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
                 raise serializers.ValidationError(
                     'Рецепт уже добавлен в список покупок!'
                 )
         if self.context['action'] == 'favorite':
-            if Favorite.objects.filter(user=user, recipe=recipe):
+            if Favorite.objects.filter(user=user, recipe=recipe).exists():
                 raise serializers.ValidationError(
                     'Рецепт уже добавлен в избранное!'
                 )
@@ -147,6 +181,8 @@ class RecipeReadMinimalSerializer(serializers.ModelSerializer):
         Определяем action - добавление в избранное или в список покупок
         и проводим соответствующие операции с БД. Возвращаем данные
         добавленного рецепта.
+        Параллельный запрос мог добавить рецепт после проверки
+        в validate, тогда срабатывает уникальное ограничение.
         """
         recipe = validated_data.pop('recipe')
         if self.context['action'] == 'favorite':
@@ -154,14 +190,24 @@ class RecipeReadMinimalSerializer(serializers.ModelSerializer):
                 user=self.context['request'].user,
                 recipe=recipe
             )
-            new_favorite.save()
+            try:
+                new_favorite.save()
+            except IntegrityError:
+                raise serializers.ValidationError(
+                    'Рецепт уже добавлен в избранное!'
+                )
 
         if self.context['action'] == 'shopping_cart':
             new_cart_item = ShoppingCart(
                 user=self.context['request'].user,
                 recipe=recipe
             )
-            new_cart_item.save()
+            try:
+                new_cart_item.save()
+            except IntegrityError:
+                raise serializers.ValidationError(
+                    'Рецепт уже добавлен в список покупок!'
+                )
         return recipe
 
 
@@ -192,24 +238,19 @@ class UserFollowWriteSerializer(UserSerializer):
         )
         model = User
 
-    def identify_author(self, instance):
-        return get_object_or_404(User, id=self.context['kwargs'].get('id'))
-
     def get_recipes(self, instance):
-        request = self.context['request']
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            serializer = RecipeReadMinimalSerializer(
-                self.identify_author(
-                    instance).recipes.all()[:int(recipes_limit)],
-                many=True
-            )
-        else:
-            serializer = RecipeReadMinimalSerializer(
-                self.identify_author(instance).recipes.all(),
-                many=True
-            )
-        return serializer.data
+        """
+        Рецепты автора, уже выбранные вьюсетом для всей страницы
+        (см. SubscriptionView.paginate_queryset), или, при подписке,
+        отдельным запросом.
+        """
+        recipes = getattr(instance, 'page_recipes', None)
+        if recipes is None:
+            recipes = instance.recipes.all()
+            recipes_limit = get_recipes_limit(self.context['request'])
+            if recipes_limit:
+                recipes = recipes[:recipes_limit]
+        return RecipeReadMinimalSerializer(recipes, many=True).data
 
     def validate(self, data):
         user = self.context['request'].user
@@ -222,7 +263,7 @@ class UserFollowWriteSerializer(UserSerializer):
                 'Нельзя подписаться на себя!'
             )
 
-        if Subscription.objects.filter(user=user, author=author):
+        if Subscription.objects.filter(user=user, author=author).exists():
             raise serializers.ValidationError(
                 'Вы уже подписаны на этого пользователя!'
             )
@@ -232,26 +273,24 @@ class UserFollowWriteSerializer(UserSerializer):
 
     @transaction.atomic
     def create(self, validated_data):
-        user = validated_data.pop('user')
-        author = self.identify_author(validated_data)
+        author = validated_data['author']
         new_subscription = Subscription(
-            user=user,
+            user=validated_data['user'],
             author=author
         )
-        new_subscription.save()
+        try:
+            new_subscription.save()
+        except IntegrityError:
+            raise serializers.ValidationError(
+                'Вы уже подписаны на этого пользователя!'
+            )
+        author.is_subscribed = True
         return author
 
     def get_recipes_count(self, instance):
-        return self.identify_author(instance).recipes.count()
-
-    def get_is_subscribed(self, instance):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=user,
-            author=self.identify_author(instance)
-        ).exists()
+        if hasattr(instance, 'recipes_count'):
+            return instance.recipes_count
+        return instance.recipes.count()
 
 
 class UserFollowReadSerializer(UserFollowWriteSerializer):
@@ -260,6 +299,3 @@ class UserFollowReadSerializer(UserFollowWriteSerializer):
     Используется для отображения существующих подписок
     Текущего пользователя.
     """
-
-    def identify_author(self, instance):
-        return instance
@@ -1,19 +1,24 @@
 from http import HTTPStatus
 
 from django.contrib.auth import authenticate
+from django.db.models import (Count, F, OuterRef, Prefetch, Subquery, Value,
+                              Window, prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from api.pagination import CustomPagination
+from api.pagination import CustomPagination, KeysetPaginationMixin
+from recipes.models import Recipe
 
 from .models import Subscription, User
 from .permissions import IsAdminorOwner, IsAuth
 from .serializers import (GetTokenSerializer, UpdatePasswordSerializer,
                           UserFollowReadSerializer, UserFollowWriteSerializer,
-                          UserSerializer)
+                          UserSerializer, get_recipes_limit)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -84,7 +89,6 @@ class UserViewSet(viewsets.ModelViewSet):
         Подписка на пользователя и отписка.
         """
         context = self.get_serializer_context()
-        author = get_object_or_404(User, id=self.kwargs.get('id'))
         if self.request.method == 'POST':
             serializer = self.serializer_class(
                 data=self.request.data,
@@ -98,7 +102,7 @@ class UserViewSet(viewsets.ModelViewSet):
             subscription = get_object_or_404(
                 Subscription,
                 user=self.request.user,
-                author=author
+                author_id=self.kwargs.get('id')
             )
             subscription.delete()
             return Response(status=HTTPStatus.NO_CONTENT)
@@ -124,12 +128,40 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(status=HTTPStatus.OK)
 
 
-class SubscriptionView(viewsets.ModelViewSet):
+def latest_recipes(author_ids, limit):
+    """
+    Последние limit рецептов каждого из авторов (все, если limit None).
+    Django 4.1 не умеет фильтровать по оконной функции, поэтому
+    запрос с ROW_NUMBER() оборачивается в подзапрос вручную.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids).order_by(
+        '-pub_date', '-id'
+    )
+    if limit is None:
+        return recipes
+    ranked = recipes.order_by().annotate(
+        author_position=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )
+    ).values('id', 'author_position')
+    sql, params = ranked.query.sql_with_params()
+    return recipes.filter(id__in=RawSQL(
+        f'SELECT ranked.id FROM ({sql}) ranked '
+        f'WHERE ranked.author_position <= %s',
+        (*params, limit)
+    ))
+
+
+class SubscriptionView(KeysetPaginationMixin, viewsets.ModelViewSet):
     """
     Эндпоинт user/subscriptions/ .
+    С параметром ?cursor= список отдается курсорной пагинацией.
     """
     serializer_class = UserFollowReadSerializer
     pagination_class = CustomPagination
+    cursor_ordering = ('-username', '-id')
     permission_classes = (IsAuth, )
 
     def get_serializer_context(self):
@@ -144,7 +176,35 @@ class SubscriptionView(viewsets.ModelViewSet):
         }
 
     def get_queryset(self):
-        return self.request.user.followers.all()
+        recipes_count = (
+            Recipe.objects.filter(author=OuterRef('pk'))
+            .order_by()
+            .values('author')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return self.request.user.followers.annotate(
+            recipes_count=Coalesce(Subquery(recipes_count), 0),
+            is_subscribed=Value(True),
+        )
+
+    def paginate_queryset(self, queryset):
+        """
+        Рецепты для всех авторов страницы выбираются одним запросом:
+        первые recipes_limit рецептов каждого автора по ROW_NUMBER()
+        в окне автора.
+        """
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            prefetch_related_objects(page, Prefetch(
+                'recipes',
+                queryset=latest_recipes(
+                    [author.id for author in page],
+                    get_recipes_limit(self.request)
+                ),
+                to_attr='page_recipes'
+            ))
+        return page
 
 
 class UserGetTokenView(generics.GenericAPIView):